@@ -0,0 +1,82 @@
+import os
+import json
+import argparse
+
+# Never open a window or touch OpenGL
+os.environ['SBB_HEADLESS'] = '1'
+
+import game
+from game.batch import BatchRunner, Policy
+from game.simulation import Simulation
+
+# NAME=VALUE to a Simulation constant and its value, of the constant's own
+# type so that integer constants stay integers
+def constant(text):
+    name, sep, value = text.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError("expected NAME=VALUE, got %r" % text)
+    if not name.isupper() or not hasattr(Simulation, name):
+        raise argparse.ArgumentTypeError("Simulation has no constant %r" % name)
+    kind = type(getattr(Simulation, name))
+    if kind is bool:
+        return name, value not in ('', '0')
+    if kind not in (int, float):
+        raise argparse.ArgumentTypeError("%s is not a number" % name)
+    try:
+        return name, kind(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("%s takes %s values, got %r" % (name, kind.__name__, value))
+
+def main():
+    parser = argparse.ArgumentParser(description='Play many headless games in parallel and summarise them')
+    parser.add_argument('--runs', type=int, default=100,
+            help='number of games to play')
+    parser.add_argument('--seed', type=int, default=0,
+            help='seed of the first game, the rest count up from it')
+    parser.add_argument('--workers', type=int, default=None,
+            help='worker processes, one per core by default')
+    parser.add_argument('--policy', choices=Policy.NAMES, default=BatchRunner.POLICY,
+            help='how the players press keys')
+    parser.add_argument('--frames', type=int, default=BatchRunner.MAX_FRAMES,
+            help='stop a game after this many simulated frames')
+    parser.add_argument('--library', default=None,
+            help='pick sections from this section library file')
+    parser.add_argument('--difficulty', type=int, nargs=2, default=None,
+            metavar=('LOW', 'HIGH'),
+            help='only use library sections with a difficulty in this range')
+    parser.add_argument('--set', type=constant, action='append', default=[],
+            metavar='NAME=VALUE', dest='constants',
+            help='override a Simulation constant such as SCROLL_RATE')
+    parser.add_argument('--vectorized', action='store_true',
+            help='step every game together with numpy box physics instead of pymunk')
+    parser.add_argument('--check-replay', action='store_true',
+            help='record every run, replay it from the log and report runs that ended differently')
+    parser.add_argument('--output', default=None,
+            help='save the summary and every run to this JSON file')
+    args = parser.parse_args()
+
+    runner = BatchRunner(args.workers, args.policy, args.frames, args.library,
+            args.difficulty, dict(args.constants), args.vectorized, args.check_replay)
+    results = runner.run(range(args.seed, args.seed + args.runs))
+    summary = runner.summarize(results)
+
+    print("%d runs, %d frames in %.2fs on %d workers (%.1fx speedup), %d finished" % (
+        summary['runs'], summary['frames'], summary['elapsed'], summary['workers'],
+        summary['speedup'], summary['finished']))
+    for name in BatchRunner.METRICS:
+        stats = summary[name]
+        print("%-9s mean %8.1f  p10 %8.1f  p50 %8.1f  p90 %8.1f  max %8.1f" % (
+            name, stats['mean'], stats['p10'], stats['p50'], stats['p90'], stats['max']))
+    if args.check_replay:
+        mismatches = summary['replay_mismatches']
+        print("%d of %d runs replayed the same%s" % (
+            summary['runs'] - len(mismatches), summary['runs'],
+            ', seeds %s did not' % mismatches if mismatches else ''))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'summary': summary, 'runs': results}, f, indent = 1, sort_keys = True)
+
+# Play the batch when running this file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import argparse
+
+# Never open a window or touch OpenGL
+os.environ['SBB_HEADLESS'] = '1'
+
+import game
+from game.benchmark import Benchmark
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the simulation and draw list hot paths')
+    parser.add_argument('--output', default=None,
+            help='save the results to this JSON file')
+    parser.add_argument('--compare', default=None, metavar='BASELINE',
+            help='compare against results saved earlier, exiting with 1 on a regression')
+    parser.add_argument('--only', nargs='+', choices=Benchmark.NAMES, default=Benchmark.NAMES,
+            help='run just these benchmarks')
+    parser.add_argument('--seed', type=int, default=Benchmark.SEED)
+    parser.add_argument('--repeat', type=int, default=Benchmark.REPEAT,
+            help='keep the best of this many runs')
+    parser.add_argument('--steps', type=int, default=Benchmark.STEPS,
+            help='physics steps per run')
+    parser.add_argument('--tolerance', type=float, default=Benchmark.TOLERANCE,
+            help='fraction a result may get worse before it is a regression')
+    args = parser.parse_args()
+
+    benchmark = Benchmark(args.seed, args.repeat, args.steps)
+    results = benchmark.run(args.only)
+    for result in results:
+        print("%-50s %12.3f %s" % (Benchmark.describe(result), result['value'], result['unit']))
+
+    if args.output is not None:
+        Benchmark.save(args.output, results)
+
+    if args.compare is not None:
+        print("")
+        regressions = 0
+        for old, new, change, regressed in Benchmark.compare(Benchmark.load(args.compare),
+                results, args.tolerance):
+            print("%-50s %+7.1f%%%s" % (Benchmark.describe(new), change * 100,
+                '  REGRESSION' if regressed else ''))
+            regressions += regressed
+        if regressions:
+            sys.exit(1)
+
+# Run benchmarks when running this file
+if __name__ == '__main__':
+    main()
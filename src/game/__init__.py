@@ -1,9 +1,22 @@
+import options
+
+import batch
+import benchmark
 import bro
 import checkpoint
 import color
 import entity
 import player
+import recording
 import resources
-import scene
 import section
+import simulation
+import headless
+import vectorized
+import library
 import tile
+
+# The rendered scene needs pyglet windowing and OpenGL
+if not options.HEADLESS:
+    import render
+    import scene
@@ -0,0 +1,253 @@
+import os
+import multiprocessing
+import numpy
+import random
+import tempfile
+
+from timeit import default_timer
+
+from simulation import Simulation
+from library import SectionLibrary
+from recording import Action, InputRecorder, Playback
+from benchmark import Benchmark
+from vectorized import VectorWorlds
+
+# Input policies, called before every step with the simulation and a
+# random generator seeded for the run
+class Policy(object):
+
+    # Chance each player presses something in a step of the random policy,
+    # and what they press, repeats making an action more likely
+    CHANCE = 0.05
+    ACTIONS = (Action.JUMP, Action.JUMP, Action.JUMP,
+            Action.MOVE_RIGHT, Action.MOVE_RIGHT, Action.STOP_RIGHT,
+            Action.MOVE_LEFT, Action.STOP_LEFT,
+            Action.FREEZE)
+
+    NAMES = ('idle', 'scripted', 'random')
+
+    @staticmethod
+    def idle(simulation, rng):
+        pass
+
+    # The benchmark's presses, the same every run
+    @staticmethod
+    def scripted(simulation, rng):
+        Benchmark.script(simulation)
+
+    @staticmethod
+    def random(simulation, rng):
+        for index in range(len(simulation.players)):
+            if rng.random() < Policy.CHANCE:
+                simulation.control(index, rng.choice(Policy.ACTIONS))
+
+# Policy's inputs for every VectorWorlds world at once, returning the
+# actions of each world and player for a step
+class VectorPolicy(object):
+
+    @staticmethod
+    def idle(worlds, rng):
+        return numpy.full((worlds.count, VectorWorlds.PLAYERS), VectorWorlds.IDLE, dtype=int)
+
+    # Benchmark.script's presses, one player at a time
+    @staticmethod
+    def scripted(worlds, rng):
+        actions = VectorPolicy.idle(worlds, rng)
+        tick = worlds.ticks
+        player = tick % VectorWorlds.PLAYERS
+        for period, action in ((37, Action.JUMP), (91, Action.MOVE_RIGHT), (400, Action.FREEZE)):
+            if tick % period == 0:
+                actions[:, player] = action
+        return actions
+
+    @staticmethod
+    def random(worlds, rng):
+        shape = (worlds.count, VectorWorlds.PLAYERS)
+        actions = numpy.array(Policy.ACTIONS)[rng.randint(len(Policy.ACTIONS), size=shape)]
+        return numpy.where(rng.random_sample(shape) < Policy.CHANCE, actions, VectorWorlds.IDLE)
+
+# Plays seeded games headless in a pool of worker processes and merges how
+# far each player got, how often they died and how often they froze into
+# one summary. Workers share nothing: each opens its own section library
+# and sets its own Simulation constants, so balance changes can be tried
+# without touching the code. Vectorized, every run is stepped together in
+# one VectorWorlds in this process instead. Checking replays, each run is
+# also recorded and played back from its log
+class BatchRunner(object):
+
+    # Three minutes of play
+    MAX_FRAMES = int(3 * 60 / Simulation.PHYSICS_FRAMERATE)
+    POLICY = 'scripted'
+    # Runs handed to a worker at a time
+    CHUNK_SIZE = 4
+
+    METRICS = ('distance', 'deaths', 'freezes')
+    PERCENTILES = (10, 50, 90)
+
+    def __init__(self, workers=None, policy=POLICY, max_frames=MAX_FRAMES,
+            library=None, difficulty=None, constants=None, vectorized=False,
+            check_replay=False, *args, **kwargs):
+        if policy not in Policy.NAMES:
+            raise ValueError("Unknown policy %r" % policy)
+        if vectorized and check_replay:
+            raise ValueError("Vectorized runs are not recorded, so they cannot be replayed")
+        constants = dict(constants or {})
+        for name in constants:
+            if not hasattr(Simulation, name):
+                raise ValueError("Simulation has no constant %r" % name)
+        self.vectorized = vectorized
+        self.workers = 1 if vectorized else workers or multiprocessing.cpu_count()
+        self.policy = policy
+        self.max_frames = max_frames
+        self.library = library
+        self.difficulty = difficulty
+        self.constants = constants
+        self.check_replay = check_replay
+        self.elapsed = 0.0
+
+    # Play one run per seed, returning their results in seed order
+    def run(self, seeds):
+        if self.vectorized:
+            return self.run_vectorized(seeds)
+        jobs = [(seed, self.policy, self.max_frames, self.difficulty, self.check_replay)
+                for seed in seeds]
+        start = default_timer()
+        pool = multiprocessing.Pool(self.workers, initializer = configure,
+                initargs = (self.library, self.constants))
+        try:
+            results = list(pool.imap_unordered(play, jobs, BatchRunner.CHUNK_SIZE))
+        finally:
+            pool.close()
+            pool.join()
+        self.elapsed = default_timer() - start
+        results.sort(key = lambda result: result['seed'])
+        return results
+
+    # Step every run in lockstep until all are over or max_frames steps,
+    # with the constants only changed while they run
+    def run_vectorized(self, seeds):
+        seeds = list(seeds)
+        policy = getattr(VectorPolicy, self.policy)
+        rng = numpy.random.RandomState(seeds[0] if seeds else None)
+        library = SectionLibrary(self.library) if self.library is not None else None
+        previous = dict((name, getattr(Simulation, name)) for name in self.constants)
+        start = default_timer()
+        cpu = cpu_time()
+        try:
+            for name, value in self.constants.items():
+                setattr(Simulation, name, value)
+            worlds = VectorWorlds(seeds, self.max_frames, library, self.difficulty)
+            while worlds.ticks < self.max_frames and not worlds.over().all():
+                worlds.step(policy(worlds, rng))
+        finally:
+            for name, value in previous.items():
+                setattr(Simulation, name, value)
+            if library is not None:
+                library.close()
+        self.elapsed = default_timer() - start
+        return worlds.results(self.elapsed, cpu_time() - cpu)
+
+    # Totals of all runs and percentiles of each metric over every player
+    # of every run. Speedup is the CPU time the runs took over the wall time
+    def summarize(self, results):
+        players = [player for result in results for player in result['players']]
+        cpu = sum(result['cpu'] for result in results)
+        summary = {
+                'runs': len(results),
+                'workers': self.workers,
+                'policy': self.policy,
+                'constants': self.constants,
+                'frames': sum(result['frames'] for result in results),
+                'finished': sum(result['over'] for result in results),
+                'elapsed': self.elapsed,
+                'speedup': cpu / self.elapsed if self.elapsed > 0 else 0.0,
+                }
+        if self.check_replay:
+            summary['replay_mismatches'] = [result['seed'] for result in results
+                    if not result['replayed']]
+        for name in BatchRunner.METRICS:
+            values = numpy.array([player[name] for player in players], dtype=float)
+            stats = {'mean': 0.0, 'min': 0.0, 'max': 0.0}
+            if len(values):
+                stats = {'mean': values.mean(), 'min': values.min(), 'max': values.max()}
+            for p in BatchRunner.PERCENTILES:
+                stats['p%d' % p] = float(numpy.percentile(values, p)) if len(values) else 0.0
+            summary[name] = stats
+        return summary
+
+# CPU time this process has used, which unlike wall time leaves out the
+# time spent waiting for a core
+def cpu_time():
+    times = os.times()
+    return times[0] + times[1]
+
+# Each worker's own section library, opened once by configure
+_library = None
+
+# Set up a worker process, module level so the pool can pickle it
+def configure(library_path, constants):
+    global _library
+    if library_path is not None:
+        _library = SectionLibrary(library_path)
+    for name, value in constants.items():
+        setattr(Simulation, name, value)
+
+# Play a single run in a worker until the game is over or max_frames steps.
+# Checking replays, the run is recorded to a temporary log and played back
+# from it, and replayed says whether the playback ended the same way
+def play(job):
+    seed, policy, max_frames, difficulty, check_replay = job
+    policy = getattr(Policy, policy)
+    rng = random.Random(seed)
+    cpu = cpu_time()
+    recorder = None
+    if check_replay:
+        handle, path = tempfile.mkstemp(suffix = '.log')
+        os.close(handle)
+        recorder = InputRecorder(path)
+    # the pool already keeps every core busy
+    simulation = Simulation(seed, _library, difficulty, recorder = recorder, threaded = False)
+    start = default_timer()
+    simulation.start()
+    try:
+        while not simulation.over and simulation.ticks < max_frames:
+            policy(simulation, rng)
+            simulation.step(Simulation.PHYSICS_FRAMERATE)
+    finally:
+        simulation.stop()
+    result = {
+            'seed': seed,
+            'frames': simulation.ticks,
+            'over': simulation.over,
+            'elapsed': default_timer() - start,
+            'players': [{
+                'distance': player.distance,
+                'deaths': player.deaths,
+                'freezes': player.freezes
+                } for player in simulation.players]
+            }
+    if check_replay:
+        recorder.close()
+        try:
+            result['replayed'] = replay(path, difficulty) == outcome(simulation)
+        finally:
+            os.remove(path)
+    result['cpu'] = cpu_time() - cpu
+    return result
+
+# How a run ended, which a faithful replay repeats
+def outcome(simulation):
+    return simulation.ticks, simulation.over, [player.distance for player in simulation.players]
+
+# Play back the one run of an input log in a worker, returning its outcome
+def replay(path, difficulty):
+    playback = Playback.load(path)[0]
+    simulation = Simulation(library = _library, difficulty = difficulty,
+            playback = playback, threaded = False)
+    simulation.start()
+    try:
+        while not playback.finished(simulation):
+            simulation.step(Simulation.PHYSICS_FRAMERATE)
+    finally:
+        simulation.stop()
+    return outcome(simulation)
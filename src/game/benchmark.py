@@ -0,0 +1,232 @@
+import json
+import numpy
+import platform
+import time
+
+from timeit import default_timer
+
+from simulation import Simulation
+from section import Section
+from template import SectionLayout
+from drawlist import DrawList
+from recording import Action
+from bro import Bro
+from tile import Tile
+
+# Times the hot paths of the simulation on seeded levels with scripted
+# input, so runs on the same machine can be compared to catch regressions.
+# Each result is a dict of its benchmark's name, the parameters it ran
+# with, a value and its unit; times are the best of repeat runs
+class Benchmark(object):
+
+    SEED = 1
+    REPEAT = 5
+    STEPS = 400
+
+    # Parameters each benchmark is run over
+    SECTIONS = (1, 8, 32, 128)
+    UPDATE_SECTIONS = (1, 8, 32)
+    UPDATE_BROS = (3, 12, 48)
+    SPAWNS = 200
+    SPAWN_PERCENTILES = (50, 90)
+    DRAW_BUILDS = 20
+
+    # Results that got worse by more than this fraction are regressions
+    TOLERANCE = 0.1
+
+    NAMES = ('physics_steps', 'update_cost', 'spawn_latency', 'draw_list')
+
+    def __init__(self, seed=SEED, repeat=REPEAT, steps=STEPS, *args, **kwargs):
+        self.seed = seed
+        self.repeat = repeat
+        self.steps = steps
+
+    def run(self, names=NAMES):
+        results = []
+        for name in names:
+            results.extend(getattr(self, name)())
+        return results
+
+    # A started simulation with extra sections pushed ahead and extra bros
+    # shared out between the players
+    def world(self, sections=1, bros=len(Simulation.COLORS)):
+        # no worker thread competing with what is timed
+        simulation = Simulation(self.seed, threaded=False)
+        simulation.start()
+        for i in range(sections - 1):
+            simulation.push_section()
+        for i in range(bros - len(simulation.players)):
+            player = simulation.players[i % len(simulation.players)]
+            simulation.add_bro(player, x=(i % 10) * Tile.SIZE, y=150 + (i // 10) * Bro.SIZE)
+        return simulation
+
+    # The same presses every run: jumping, walking right and freezing
+    @staticmethod
+    def script(simulation):
+        tick = simulation.ticks
+        player = tick % len(simulation.players)
+        if tick % 37 == 0:
+            simulation.control(player, Action.JUMP)
+        if tick % 91 == 0:
+            simulation.control(player, Action.MOVE_RIGHT)
+        if tick % 400 == 0:
+            simulation.control(player, Action.FREEZE)
+
+    # Best time of repeat runs of measure on fresh worlds
+    def best(self, measure, *args):
+        times = []
+        for i in range(self.repeat):
+            simulation = self.world(*args)
+            try:
+                times.append(measure(simulation))
+            finally:
+                simulation.stop()
+        return min(times)
+
+    @staticmethod
+    def result(name, params, value, unit, higher_is_better=False):
+        return {
+                'name': name,
+                'params': params,
+                'value': value,
+                'unit': unit,
+                'higher_is_better': higher_is_better
+                }
+
+    # Physics steps per second with more and more static tiles in the space.
+    # A step is the physics part of Simulation.step, ground tracking and the
+    # bro updates that turn the scripted input into velocities, without
+    # scrolling or sections
+    def physics_steps(self):
+        results = []
+        for sections in Benchmark.SECTIONS:
+            tiles = []
+            def measure(simulation):
+                tiles.append(len(simulation.store.of_kind(Tile.KIND)))
+                dt = Simulation.PHYSICS_FRAMERATE
+                start = default_timer()
+                for i in range(self.steps):
+                    Benchmark.script(simulation)
+                    simulation.update_physics(dt)
+                    simulation.store.sync()
+                    for bro in simulation.bros:
+                        bro.update(dt)
+                    simulation.ticks += 1
+                return default_timer() - start
+            elapsed = self.best(measure, sections)
+            results.append(Benchmark.result('physics_steps',
+                {'sections': sections, 'tiles': tiles[0]},
+                self.steps / elapsed, 'steps/s', True))
+        return results
+
+    # Milliseconds per step of the work GameScene.update does without
+    # drawing, by live sections and bros
+    def update_cost(self):
+        results = []
+        for sections in Benchmark.UPDATE_SECTIONS:
+            for bros in Benchmark.UPDATE_BROS:
+                def measure(simulation):
+                    start = default_timer()
+                    for i in range(self.steps):
+                        Benchmark.script(simulation)
+                        simulation.step(Simulation.PHYSICS_FRAMERATE)
+                        simulation.interpolate(1.0)
+                    return default_timer() - start
+                elapsed = self.best(measure, sections, bros)
+                results.append(Benchmark.result('update_cost',
+                    {'sections': sections, 'bros': bros},
+                    elapsed / self.steps * 1000, 'ms'))
+        return results
+
+    # Milliseconds to lay out a section and to commit it to the world
+    def spawn_latency(self):
+        simulation = self.world()
+        layouts = []
+        commits = []
+        try:
+            for i in range(Benchmark.SPAWNS):
+                offset = simulation.current_distance
+                start = default_timer()
+                template = Section.choose_template(simulation.random)
+                layout = SectionLayout.create(offset, template, simulation.random)
+                layouts.append(default_timer() - start)
+
+                start = default_timer()
+                section = Section(offset, simulation.space, simulation.store, simulation.random,
+                        pool = simulation.tile_pool, layout = layout)
+                simulation.sections.append(section)
+                simulation.current_distance += section.length
+                commits.append(default_timer() - start)
+        finally:
+            simulation.stop()
+
+        results = []
+        for name, times in (('layout', layouts), ('commit', commits)):
+            times = numpy.array(times) * 1000
+            for p in Benchmark.SPAWN_PERCENTILES:
+                results.append(Benchmark.result('spawn_latency',
+                    {'stage': name, 'percentile': p},
+                    float(numpy.percentile(times, p)), 'ms'))
+        return results
+
+    # Milliseconds to pick out what the camera sees and build every vertex
+    # the renderers would upload for it
+    def draw_list(self):
+        results = []
+        for sections in Benchmark.SECTIONS:
+            def measure(simulation):
+                store = simulation.store
+                left = simulation.camera[0]
+                right = simulation.camera[2]
+                half_size = Bro.SIZE / 2.0
+                start = default_timer()
+                for i in range(Benchmark.DRAW_BUILDS):
+                    for section in simulation.visible_sections():
+                        DrawList.tiles(section.tiles)
+                    slots = DrawList.visible(store, store.slots(Bro.KIND), left, right, half_size)
+                    DrawList.entities(store, slots, half_size, len(slots))
+                return default_timer() - start
+            elapsed = self.best(measure, sections)
+            results.append(Benchmark.result('draw_list',
+                {'sections': sections}, elapsed / Benchmark.DRAW_BUILDS * 1000, 'ms'))
+        return results
+
+    @staticmethod
+    def save(path, results):
+        with open(path, 'w') as f:
+            json.dump({
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results
+                }, f, indent = 1, sort_keys = True)
+
+    @staticmethod
+    def load(path):
+        with open(path) as f:
+            return json.load(f)['results']
+
+    @staticmethod
+    def key(result):
+        return result['name'], tuple(sorted(result['params'].items()))
+
+    # Pair up results of two runs, returning (old, new, change, regressed)
+    # for each, change being how much better new is as a fraction
+    @staticmethod
+    def compare(old, new, tolerance=TOLERANCE):
+        before = dict((Benchmark.key(r), r) for r in old)
+        comparison = []
+        for result in new:
+            previous = before.get(Benchmark.key(result))
+            if previous is None or previous['value'] == 0:
+                continue
+            change = result['value'] / previous['value'] - 1
+            if not result['higher_is_better']:
+                change = -change
+            comparison.append((previous, result, change, change < -tolerance))
+        return comparison
+
+    @staticmethod
+    def describe(result):
+        params = ', '.join('%s=%s' % item for item in sorted(result['params'].items()))
+        return '%s (%s)' % (result['name'], params)
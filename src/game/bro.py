@@ -1,13 +1,15 @@
+import pymunk
+
 import entity
 import tile
-import resources
-
-import weakref
-from pyglet.app import WeakSet
+from tilerun import TileRun
 
 # An avatar controlled by a Player
 class Bro(entity.Entity):
 
+    __slots__ = ('player', '_color', 'dead', 'frozen', 'moving_left', 'moving_right',
+            'collide_left', 'collide_right', 'ground', '_last_tile')
+
     MASS = 10
     FRICTION = 0
     SIZE = 32 
@@ -17,8 +19,14 @@ class Bro(entity.Entity):
 
     FREEZE_FADE = 0.3
 
+    # How far from under a bro's middle something may be and still be stood on
+    REQUIRED_OVERLAP = 15
+    # How far from a bro's feet something still touches them
+    GROUND_GAP = 1.0
+
     COLLISION_TYPE = 2
     FROZEN_COLLISION_TYPE = 3
+    KIND = 2
 
     @property
     def color(self):
@@ -38,47 +46,57 @@ class Bro(entity.Entity):
         self.green = 1
         self.blue = 1
 
+    # The last tile is kept by its store handle, it is gone once the tile
+    # leaves the store
     @property
     def last_tile(self):
         if self._last_tile is None:
             return None
-        else:
-            return self._last_tile()
+        return self.store.get(self._last_tile)
 
     @last_tile.setter
     def last_tile(self, val):
         # untint old last tile
-        if self._last_tile is not None:
-            self._last_tile().unset_last_tile_for(self)
+        old = self.last_tile
+        if old is not None:
+            old.unset_last_tile_for(self)
 
         if val is None:
             self._last_tile = None
         else:
-            self._last_tile = weakref.ref(val)
-            self._last_tile().set_last_tile_for(self)
+            self._last_tile = val.handle
+            val.set_last_tile_for(self)
 
-    def __init__(self, player, space, x=0, y=0, old_bro=None, *args, **kwargs):
-        super(Bro, self).__init__(space, 
+    def __init__(self, player, space, store, x=0, y=0, old_bro=None, *args, **kwargs):
+        super(Bro, self).__init__(space, store,
                 x = x,
                 y = y,
                 mass = Bro.MASS,
                 friction = Bro.FRICTION,
                 collision_type = Bro.COLLISION_TYPE,
                 width = Bro.SIZE,
-                height = Bro.SIZE,
-                texture = resources.box)
+                height = Bro.SIZE)
+        self._reset(player, old_bro)
+
+    # Reuse a pooled bro for a player
+    def spawn(self, player, x=0, y=0, old_bro=None):
+        self.place(x, y)
+        self._reset(player, old_bro)
+
+    def _reset(self, player, old_bro):
         self.player = player
         self.color = player.color
         self.dead = False
         self.frozen = False
-        self.player.bros.append(self)
+        self.player.bro = self
 
         # Model state
         self.moving_left = False
         self.moving_right = False
         self.collide_left = False
         self.collide_right = False
-        self.shapes_below = WeakSet()
+        # shapes holding the bro up as of the last step
+        self.ground = ()
         self._last_tile = None
 
         # get old bro values
@@ -98,7 +116,12 @@ class Bro(entity.Entity):
         else:
             target_velocity = 0
 
-        self.pymunk_body.velocity.x = target_velocity
+        if not self.static:
+            body = self.pymunk_body
+            if target_velocity != 0:
+                # wake the body in case it fell asleep while resting
+                body.activate()
+            body.velocity.x = target_velocity
 
         # update player distance
         self.player.distance = int(max(self.x, self.player.distance))
@@ -136,13 +159,13 @@ class Bro(entity.Entity):
 
     def jump(self):
         if self.can_jump():
+            self.pymunk_body.activate()
             self.pymunk_body.apply_impulse(Bro.JUMP_VECTOR, (0, 0))
-            # clear the shapes below set 
-            for shape in self.shapes_below:
-                self.shapes_below.remove(shape)
+            # leave the ground until the next step finds it again
+            self.ground = ()
 
     def can_jump(self):
-        return len(self.shapes_below) > 0
+        return len(self.ground) > 0
 
     def move_right(self):
         self.moving_right = True
@@ -162,70 +185,39 @@ class Bro(entity.Entity):
         self.stop_right()
         self.stop_left()
 
-    @staticmethod
-    def setup_collision_handlers(outer_space):
-
-        required_overlap = 15
-
-        # Prior to solbing collision
-        def pre_solve_handler(space, arbiter):
-            contact = arbiter.contacts[0]
-
-            a = arbiter.shapes[0]
-            b = arbiter.shapes[1]
-            # if a is above b
-            if abs(a.body.position.x - b.body.position.x) < required_overlap:
-                if a.body.position.y > b.body.position.y:
-                    record_shape_below(a, b)
-                # otherwise b is above a
-                else:
-                    record_shape_below(b, a)
-
-            # Allow sliding down walls (sorta, we still catch on 'corners')
-            if round(contact.normal.x) == 1:
-                body = arbiter.shapes[0].body
-                bro = body.entity
-                #body.velocity.x = contact.normal.x * Bro.SPEED
-
-            return True
-
-        def record_shape_below(above, below):
-            bro = above.entity
-            if type(bro) is Bro and not bro.frozen:
-                # record this as an object under us
-                bro.shapes_below.add(below)
-
-                # check if we should record the last tile for this bro
-                t = below.entity
-                if type(t) is tile.Tile and t.static:
-                    bro.last_tile = t
-
-        # When first seperating
-        def separate_handler(space, arbiter):
-            # One less object below
-            bro_shape = arbiter.shapes[0]
-            bro = bro_shape.entity
-            other_shape = arbiter.shapes[1]
-            other = other_shape.entity
-
-            # Remove object if it was below 
-            if other_shape in bro.shapes_below:
-                bro.shapes_below.remove(other_shape)
-
-            return True
-
-        # Handlers between bros and tiles
-        outer_space.add_collision_handler(
-                Bro.COLLISION_TYPE, 
-                tile.Tile.COLLISION_TYPE,
-                pre_solve = pre_solve_handler,
-                separate = separate_handler
-            )
-
-        # Handlers between bros
-        outer_space.add_collision_handler(
-                Bro.COLLISION_TYPE, 
-                Bro.COLLISION_TYPE, 
-                pre_solve = pre_solve_handler,
-                separate = separate_handler
-            )
+    # Find what holds the bro up after a step, with one query of the space
+    # for the shapes touching its feet. A shape is stood on once its middle
+    # is under the bro's and stays under it until they no longer touch. The
+    # closest static tile stood on is the bro's last tile
+    def find_ground(self):
+        shape = self.pymunk_shape
+        bb = shape.bb
+        gap = Bro.GROUND_GAP
+        feet = pymunk.BB(bb.left + gap, bb.bottom - gap, bb.right - gap, bb.bottom + gap)
+        x, y = self.pymunk_body.position
+
+        ground = []
+        last_tile = None
+        for other in self.space.bb_query(feet):
+            if other is shape:
+                continue
+            below = other.entity
+            # a merged run of tiles stands in for its tile closest to the bro
+            if type(below) is TileRun:
+                below = below.tile_near(x, y)
+            # static shapes all share the space's static body so ask the entity
+            if below.static:
+                bx, by = below.x, below.y
+            else:
+                bx, by = other.body.position
+            if by < y and abs(bx - x) < Bro.REQUIRED_OVERLAP:
+                ground.append(other)
+                if type(below) is tile.Tile and below.static and \
+                        (last_tile is None or abs(bx - x) < abs(last_tile.x - x)):
+                    last_tile = below
+            elif other in self.ground:
+                ground.append(other)
+        self.ground = ground
+
+        if last_tile is not None and last_tile is not self.last_tile:
+            self.last_tile = last_tile
@@ -0,0 +1,68 @@
+import numpy
+
+from math import cos, sin, radians
+
+from tile import Tile
+from store import EntityStore
+
+# Vertex data the renderers upload, built without OpenGL so it can also be
+# built and timed headless
+class DrawList(object):
+
+    VERTS_PER_QUAD = 4
+
+    # Unit square corners in the same order as the texture coordinates
+    CORNERS = numpy.array([(-1, -1), (1, -1), (1, 1), (-1, 1)], dtype=float)
+
+    # Quad corners of a tile at its drawn position
+    @staticmethod
+    def quad(tile):
+        x, y, rot = tile.drawn
+        h = Tile.SIZE / 2.0
+        if rot == 0:
+            return (x - h, y - h, x + h, y - h, x + h, y + h, x - h, y + h)
+        c = cos(radians(rot)) * h
+        s = sin(radians(rot)) * h
+        return (x - c + s, y - s - c, x + c + s, y + s - c,
+                x + c - s, y + s + c, x - c - s, y - s + c)
+
+    @staticmethod
+    def color(tile):
+        return (tile.red, tile.green, tile.blue, tile.alpha) * DrawList.VERTS_PER_QUAD
+
+    # Flat vertex and colour lists for a run of tiles
+    @staticmethod
+    def tiles(tiles):
+        vertices = []
+        colors = []
+        for tile in tiles:
+            vertices.extend(DrawList.quad(tile))
+            colors.extend(DrawList.color(tile))
+        return vertices, colors
+
+    # The slots whose squares reach between left and right
+    @staticmethod
+    def visible(store, slots, left, right, half_size):
+        x = store.drawn[slots, EntityStore.X]
+        return slots[(x + half_size >= left) & (x - half_size <= right)]
+
+    # Vertex and colour arrays with room for capacity quads, the first of
+    # them filled in for the entities in slots, each square rotated by its
+    # drawn angle
+    @staticmethod
+    def entities(store, slots, half_size, capacity):
+        count = len(slots)
+        drawn = store.drawn[slots]
+        angles = numpy.radians(drawn[:, EntityStore.ROT])
+        cos_a = numpy.cos(angles)[:, None] * half_size
+        sin_a = numpy.sin(angles)[:, None] * half_size
+        cx = DrawList.CORNERS[:, 0]
+        cy = DrawList.CORNERS[:, 1]
+
+        vertices = numpy.zeros((capacity, 4, 2), dtype=numpy.float32)
+        vertices[:count, :, 0] = drawn[:, EntityStore.X, None] + cx * cos_a - cy * sin_a
+        vertices[:count, :, 1] = drawn[:, EntityStore.Y, None] + cx * sin_a + cy * cos_a
+
+        colors = numpy.zeros((capacity, 4, 4), dtype=numpy.float32)
+        colors[:count] = store.rgba[slots, None, :]
+        return vertices, colors
@@ -1,9 +1,21 @@
-import rabbyt
 import pymunk
-from math import degrees
+from math import degrees, radians, cos, sin
 
-# An object with a sprite and presence in the physucs space
-class Entity(rabbyt.Sprite):
+from store import EntityStore
+
+# An object with presence in the physucs space, its drawn position and colour
+# live in an EntityStore. Entities are slotted, there are thousands of tiles
+class Entity(object):
+
+    __slots__ = ('space', '_mass', '_moment', '_vertices', '_friction',
+            '_collision_type', 'pymunk_body', 'pymunk_shape', '_static_shape',
+            '_dynamic_shape', '_static', 'store', 'slot', 'handle')
+
+    # Lets renderers pick out entities of one type from the store
+    KIND = 0
+
+    # Moment and vertices of each box in use, shared by every entity of it
+    BOXES = {}
 
     @property
     def static(self):
@@ -13,28 +25,125 @@ class Entity(rabbyt.Sprite):
     def static(self, val):
         # Check if value is changes
         if self.static != val:
+            x, y, angle = self._pose()
             self._static = val
             if self.static:
-                self._set_static()
-                # remove body from physics space and make it static
-                self.space.remove(self.pymunk_body)
+                self._set_static(x, y, angle)
             else:
-                self._set_dynamic()
-                # add body to physics space and make dynamic
-                self.space.add(self.pymunk_body)
+                self._set_dynamic(x, y, angle)
+            self.store.set_static(self, val)
+
+    # Current position and angle, from the body while it is simulated
+    def _pose(self):
+        if self.static:
+            return self.x, self.y, radians(self.rot)
+        position = self.pymunk_body.position
+        return position.x, position.y, self.pymunk_body.angle
+
+    # Static entities hang their shape off the space's static body, placed
+    # where the entity stands. The solver and spatial index do no work for it
+    def _set_static(self, x, y, angle):
+        if self.pymunk_shape is not None:
+            self.space.remove(self.pymunk_body, self.pymunk_shape)
+        if angle == 0:
+            vs = [(x + vx, y + vy) for vx, vy in self._vertices]
+        else:
+            c = cos(angle)
+            s = sin(angle)
+            vs = [(x + vx * c - vy * s, y + vx * s + vy * c) for vx, vy in self._vertices]
+        # the shape is kept and moved while out of the space
+        if self._static_shape is None:
+            self._static_shape = pymunk.Poly(self.space.static_body, vs)
+        else:
+            self._static_shape.unsafe_set_vertices(vs)
+        self._set_shape(self._static_shape)
+
+    # Dynamic entities get their own body and shape, only built the first time
+    def _set_dynamic(self, x, y, angle):
+        if self.pymunk_shape is not None:
+            self.space.remove(self.pymunk_shape)
+        if self.pymunk_body is None:
+            self.pymunk_body = pymunk.Body(self._mass, self._moment)
+            # allow access the the entity from the body
+            self.pymunk_body.entity = self
+            self._dynamic_shape = pymunk.Poly(self.pymunk_body, self._vertices)
+        body = self.pymunk_body
+        body.position = x, y
+        body.angle = angle
+        body.velocity = 0, 0
+        body.angular_velocity = 0
+        self.space.add(body)
+        self._set_shape(self._dynamic_shape)
+
+    def _set_shape(self, shape):
+        shape.friction = self._friction
+        shape.collision_type = self._collision_type
+        # allow access the the entity from the shape
+        shape.entity = self
+        self.space.add(shape)
+        self.pymunk_shape = shape
+
+    # Physics state as of the last step
+    @property
+    def x(self):
+        return self.store.state[self.slot, EntityStore.X]
+
+    @property
+    def y(self):
+        return self.store.state[self.slot, EntityStore.Y]
+
+    @property
+    def rot(self):
+        return self.store.state[self.slot, EntityStore.ROT]
+
+    @property
+    def red(self):
+        return self.store.rgba[self.slot, 0]
 
-    def _set_static(self):
-        self.pymunk_body.velocity = 0, 0
-        self.pymunk_body.angular_velocity = 0
-        self.pymunk_body.mass = pymunk.inf
-        self.pymunk_body.moment = pymunk.inf
+    @red.setter
+    def red(self, val):
+        self.store.rgba[self.slot, 0] = val
 
-    def _set_dynamic(self):
-        self.pymunk_body.mass = self._mass
-        self.pymunk_body.moment = self._moment
+    @property
+    def green(self):
+        return self.store.rgba[self.slot, 1]
+
+    @green.setter
+    def green(self, val):
+        self.store.rgba[self.slot, 1] = val
+
+    @property
+    def blue(self):
+        return self.store.rgba[self.slot, 2]
+
+    @blue.setter
+    def blue(self, val):
+        self.store.rgba[self.slot, 2] = val
+
+    @property
+    def alpha(self):
+        return self.store.rgba[self.slot, 3]
+
+    @alpha.setter
+    def alpha(self, val):
+        self.store.rgba[self.slot, 3] = val
+
+    @property
+    def rgb(self):
+        return tuple(self.store.rgba[self.slot, :3])
+
+    @rgb.setter
+    def rgb(self, val):
+        self.store.rgba[self.slot, :3] = val
+
+    # Interpolated position and rotation to draw at
+    @property
+    def drawn(self):
+        return tuple(self.store.drawn[self.slot])
 
     def __init__(self, 
             space, 
+            store,
             collision_type = 0,
             group = 0,
             friction = pymunk.inf,
@@ -47,45 +156,47 @@ class Entity(rabbyt.Sprite):
             static = False, 
             *args, **kwargs):
 
-        super(Entity, self).__init__(*args, **kwargs)
-
         # Physics setup
         self.space = space
         self._mass = mass
-        self._moment = pymunk.moment_for_box(mass, width, height)
+        self._moment, self._vertices = Entity.box(mass, width, height)
+        self._friction = friction
+        self._collision_type = collision_type
+        self.pymunk_body = None
+        self.pymunk_shape = None
+        self._static_shape = None
+        self._dynamic_shape = None
 
-        # body
-        body = pymunk.Body(self._mass, self._moment)
-        body.position = x, y
-        body.angle = angle
-
-        # shape
-        hw = width // 2
-        hh = height // 2
-        vs = [(-hw, hh), (hw, hh), (hw, -hh), (-hw, -hh)]
-        shape = pymunk.Poly(body, vs)
-        shape.friction = friction
-        shape.collision_type = collision_type
-        space.add(shape)
-
-        self.pymunk_shape = shape
-        self.pymunk_body = body
-        if static: self._set_static()
+        self.store = store
+        self.place(x, y, angle, static)
 
-        # force static state update if not static
-        self._static = True
-        self.static = static
+    # Add the entity to the store and space. Entities recycled by a Pool are
+    # placed again once out of both, reusing their body and shapes
+    def place(self, x, y, angle=0, static=False):
+        self.pymunk_shape = None
+        self.store.add(self, x, y, degrees(angle), static)
+        self._static = static
+        if static:
+            self._set_static(x, y, angle)
+        else:
+            self._set_dynamic(x, y, angle)
 
-        # allow access the the entity from the shape for body
-        self.pymunk_body.entity = self
-        self.pymunk_shape.entity = self
+    @staticmethod
+    def box(mass, width, height):
+        key = (mass, width, height)
+        if key not in Entity.BOXES:
+            hw = width // 2
+            hh = height // 2
+            vs = [(-hw, hh), (hw, hh), (hw, -hh), (-hw, -hh)]
+            Entity.BOXES[key] = (pymunk.moment_for_box(mass, width, height), vs)
+        return Entity.BOXES[key]
 
+    # Position is synced in bulk by the EntityStore, subclasses add behaviour
     def update(self, dt):
-        self.x = self.pymunk_body.position.x
-        self.y = self.pymunk_body.position.y
-        self.rot = degrees(self.pymunk_body.angle)
+        pass
 
     def remove_from_space(self):
-        self.space.remove(self.pymunk_shape)
+        if self.pymunk_shape is not None:
+            self.space.remove(self.pymunk_shape)
         if not self.static:
             self.space.remove(self.pymunk_body)
@@ -0,0 +1,84 @@
+import Queue
+import threading
+
+from section import Section
+from template import SectionLayout
+
+# Works out the layouts of upcoming sections ahead of time on a worker
+# thread, keeping up to lookahead of them ready. Layouts come from their own
+# random generator in a fixed order, so a seeded level is the same however
+# far ahead the thread has got. Unthreaded it generates each one on demand.
+# Templates are chosen as by Section.choose_template
+class SectionGenerator(object):
+
+    LOOKAHEAD = 4
+
+    def __init__(self, rng, library=None, difficulty=None, lookahead=LOOKAHEAD,
+            threaded=True, *args, **kwargs):
+        self.rng = rng
+        self.library = library
+        self.difficulty = difficulty
+        # a range with no sections fails here rather than on the worker
+        if library is not None and difficulty is not None:
+            library.span(*difficulty)
+        self.layouts = self.generate()
+        self.queue = None
+        self.running = False
+        # what ended the worker, raised by every later next
+        self.error = None
+        if threaded:
+            self.queue = Queue.Queue(lookahead)
+            self.running = True
+            self.thread = threading.Thread(target = self.run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    # Endless layouts, each one starting where the last one ended
+    def generate(self):
+        offset = 0
+        while True:
+            template = Section.choose_template(self.rng, self.library,
+                    difficulty = self.difficulty)
+            layout = SectionLayout.create(offset, template, self.rng)
+            yield layout
+            offset += layout.length
+
+    # An error generating layouts ends the worker, it is queued in place of
+    # the next layout so next raises it instead of waiting forever
+    def run(self):
+        try:
+            for layout in self.layouts:
+                # blocks while lookahead layouts are waiting
+                self.queue.put(layout)
+                if not self.running:
+                    return
+        except Exception as e:
+            self.queue.put(e)
+
+    # The next layout, waiting for the worker if it has fallen behind
+    def next(self):
+        if self.queue is None:
+            return next(self.layouts)
+        if self.error is not None:
+            raise self.error
+        layout = self.queue.get()
+        if isinstance(layout, Exception):
+            self.error = layout
+            raise layout
+        return layout
+
+    # Layouts generated and not yet taken
+    def ready(self):
+        if self.queue is None:
+            return 0
+        return self.queue.qsize()
+
+    # Free a place in the queue so a blocked worker wakes up and finishes,
+    # a worker that already ended needs nothing
+    def stop(self):
+        self.running = False
+        if self.queue is not None and self.thread.is_alive():
+            try:
+                self.queue.get_nowait()
+            except Queue.Empty:
+                pass
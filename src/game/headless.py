@@ -0,0 +1,47 @@
+import time
+
+from simulation import Simulation
+
+# Steps a Simulation as fast as the CPU allows with no window or vsync,
+# measuring how many frames were simulated per second
+class HeadlessRunner(object):
+
+    # One frame is one fixed physics step
+    FRAME_TIME = Simulation.PHYSICS_FRAMERATE
+
+    def __init__(self, simulation=None, seed=None, *args, **kwargs):
+        if simulation is None:
+            simulation = Simulation(seed)
+        self.simulation = simulation
+        self.frames = 0
+        self.elapsed = 0.0
+
+    def fps(self):
+        if self.elapsed <= 0:
+            return 0.0
+        return self.frames / self.elapsed
+
+    def frame(self):
+        self.simulation.step(HeadlessRunner.FRAME_TIME)
+        self.simulation.profiler.frame()
+        self.frames += 1
+
+    # Run until the game is over, max_frames have been simulated or
+    # max_seconds of wall time have passed
+    def run(self, max_frames=None, max_seconds=None):
+        self.simulation.start()
+        self.simulation.profiler.clear()
+        self.frames = 0
+        self.elapsed = 0.0
+
+        start = time.time()
+        while not self.simulation.over:
+            if max_frames is not None and self.frames >= max_frames:
+                break
+            self.frame()
+            self.elapsed = time.time() - start
+            if max_seconds is not None and self.elapsed >= max_seconds:
+                break
+
+        self.simulation.stop()
+        return self.fps()
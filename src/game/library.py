@@ -0,0 +1,157 @@
+import mmap
+import struct
+import bisect
+import numpy
+
+from collections import OrderedDict
+
+from template import SectionTemplate
+
+# A file of section layouts read through mmap. Only the header is read when
+# opening, each grid is unpacked and compiled the first time it is used, so
+# opening does not get slower with the number of sections.
+#
+# Layout, all little endian:
+#   header   magic, version, section count
+#   index    one record per section, ordered by difficulty: offset of its
+#            grid, width, height, difficulty and the running total of
+#            weights up to and including it
+#   grids    one bit per cell, rows from the top, each grid padded to a byte
+class SectionLibrary(object):
+
+    MAGIC = b'SBBL'
+    VERSION = 1
+
+    HEADER = struct.Struct('<4sHxxI')
+    RECORD = struct.Struct('<IHHHxxd')
+    MAX_DIFFICULTY = 0xffff
+
+    # Compiled templates kept around, least recently used go first
+    CACHE_SIZE = 64
+
+    def __init__(self, path, cache_size=CACHE_SIZE, *args, **kwargs):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+
+        magic, version, self.count = SectionLibrary.HEADER.unpack_from(self.data, 0)
+        if magic != SectionLibrary.MAGIC:
+            raise ValueError("%s is not a section library" % path)
+        if version != SectionLibrary.VERSION:
+            raise ValueError("%s has unsupported version %d" % (path, version))
+
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+
+    def __len__(self):
+        return self.count
+
+    # Lets random.choice pick from the library uniformly
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self.template(index)
+
+    def record(self, index):
+        offset = SectionLibrary.HEADER.size + index * SectionLibrary.RECORD.size
+        return SectionLibrary.RECORD.unpack_from(self.data, offset)
+
+    def difficulty(self, index):
+        return self.record(index)[3]
+
+    def weight(self, index):
+        return self.total_weight(index + 1) - self.total_weight(index)
+
+    # Sum of the weights of the first count sections
+    def total_weight(self, count):
+        if count == 0:
+            return 0.0
+        return self.record(count - 1)[4]
+
+    def template(self, index):
+        if index in self.cache:
+            template = self.cache.pop(index)
+        else:
+            template = SectionTemplate(self.grid(index))
+            if len(self.cache) >= self.cache_size:
+                self.cache.popitem(last = False)
+        self.cache[index] = template
+        return template
+
+    def grid(self, index):
+        offset, width, height, difficulty, total = self.record(index)
+        size = (width * height + 7) // 8
+        packed = numpy.frombuffer(self.data, numpy.uint8, size, offset)
+        bits = numpy.unpackbits(packed)[:width * height]
+        return bits.reshape(height, width).tolist()
+
+    # Pick a section at random in proportion to its weight, optionally only
+    # from those with a difficulty in [low, high]. Both the difficulty range
+    # and the weight are found by binary search over the index
+    def choose(self, rng, low=None, high=None):
+        first, last = self.span(low, high)
+        start = self.total_weight(first)
+        target = start + rng.random() * (self.total_weight(last) - start)
+        index = self.bisect(first, last, lambda i: self.record(i)[4] <= target)
+        return self.template(min(index, last - 1))
+
+    # Indices [first, last) of the sections with a difficulty in [low, high]
+    def span(self, low=None, high=None):
+        first = 0 if low is None else self.bisect_difficulty(low)
+        last = self.count if high is None else self.bisect_difficulty(high + 1)
+        if first >= last:
+            raise ValueError("%s has no sections with difficulty %s to %s" % (self.path, low, high))
+        return first, last
+
+    # First section with at least this difficulty
+    def bisect_difficulty(self, difficulty):
+        return self.bisect(0, self.count, lambda i: self.difficulty(i) < difficulty)
+
+    # First index in [low, high) where before no longer holds
+    @staticmethod
+    def bisect(low, high, before):
+        while low < high:
+            middle = (low + high) // 2
+            if before(middle):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    # Pack grids into a library file. Sections are stored ordered by
+    # difficulty, keeping the given order between equal difficulties.
+    # Difficulties are stored unsigned in 16 bits
+    @staticmethod
+    def write(path, grids, weights=None, difficulties=None):
+        count = len(grids)
+        if weights is None:
+            weights = [1.0] * count
+        if difficulties is None:
+            difficulties = [0] * count
+        for i, difficulty in enumerate(difficulties):
+            if not 0 <= difficulty <= SectionLibrary.MAX_DIFFICULTY:
+                raise ValueError("section %d has difficulty %d, outside 0 to %d"
+                        % (i, difficulty, SectionLibrary.MAX_DIFFICULTY))
+        order = sorted(range(count), key = lambda i: difficulties[i])
+
+        offset = SectionLibrary.HEADER.size + count * SectionLibrary.RECORD.size
+        index = []
+        packed = []
+        total = 0.0
+        for i in order:
+            grid = numpy.array(grids[i], dtype=numpy.uint8) != 0
+            height, width = grid.shape
+            bits = numpy.packbits(grid.ravel()).tostring()
+            total += weights[i]
+            index.append(SectionLibrary.RECORD.pack(offset, width, height, difficulties[i], total))
+            packed.append(bits)
+            offset += len(bits)
+
+        with open(path, 'wb') as f:
+            f.write(SectionLibrary.HEADER.pack(SectionLibrary.MAGIC, SectionLibrary.VERSION, count))
+            f.write(b''.join(index))
+            f.write(b''.join(packed))
@@ -0,0 +1,35 @@
+# Calls step with a fixed timestep however long each frame took. Frame time
+# is banked in an accumulator and spent in whole steps, anything left over is
+# reported as an interpolation factor between the last two steps
+class FixedStepLoop(object):
+
+    # Most steps run in a single frame, time past this is dropped so a slow
+    # frame can not snowball into ever more catch up work
+    MAX_STEPS = 5
+
+    def __init__(self, step, step_time, max_steps=MAX_STEPS, *args, **kwargs):
+        self.step = step
+        self.step_time = step_time
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.ticks = 0
+
+    def advance(self, dt):
+        self.accumulator += dt
+
+        steps = 0
+        while self.accumulator >= self.step_time and steps < self.max_steps:
+            self.step(self.step_time)
+            self.accumulator -= self.step_time
+            self.ticks += 1
+            steps += 1
+
+        # Drop time we could not catch up on
+        if self.accumulator >= self.step_time:
+            self.accumulator = self.accumulator % self.step_time
+
+        return self.alpha()
+
+    # How far between the previous and current step the frame lies
+    def alpha(self):
+        return self.accumulator / self.step_time
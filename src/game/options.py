@@ -0,0 +1,16 @@
+import os
+
+# Run the game without a window, OpenGL context or rabbyt sprites. Must be
+# set in the environment before the game package is imported
+HEADLESS = os.environ.get('SBB_HEADLESS', '0') not in ('', '0')
+
+# Write every player's input to this file as a stream of runs
+RECORD = os.environ.get('SBB_RECORD')
+
+# Play the runs in this input log back instead of taking input, this many
+# times faster than real time
+REPLAY = os.environ.get('SBB_REPLAY')
+REPLAY_SPEED = float(os.environ.get('SBB_REPLAY_SPEED', '4'))
+
+# Show the frame profiler's graph from the start, F10 toggles it
+PROFILE_GRAPH = os.environ.get('SBB_PROFILE_GRAPH', '0') not in ('', '0')
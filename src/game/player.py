@@ -1,15 +1,18 @@
 # Represents an actual player of the game
 class Player(object):
 
-    def __init__(self, color, *args, **kwargs):
-        self.bros = []
+    def __init__(self, color, index=0, *args, **kwargs):
+        # the last bro spawned for the player, the only one it controls
+        self.bro = None
         self.color = color
+        # the player's bit in the tints of a tile
+        self.bit = 1 << index
         self.deaths = 0
         self.freezes = 0
         self.distance = 0
 
     def active_bro(self):
-        if len(self.bros) > 0 and self.bros[-1].alive():
-            return self.bros[-1]
+        if self.bro is not None and self.bro.alive():
+            return self.bro
         else:
             return None
@@ -0,0 +1,23 @@
+# Keeps entities that left the world so they can be spawned again instead
+# of built from scratch. Released entities hold on to their pymunk body and
+# shapes, acquire passes its arguments to spawn or, with nothing free, to
+# create
+class Pool(object):
+
+    def __init__(self, create, *args, **kwargs):
+        self.create = create
+        self.free = []
+
+    def acquire(self, *args, **kwargs):
+        if self.free:
+            entity = self.free.pop()
+            entity.spawn(*args, **kwargs)
+            return entity
+        return self.create(*args, **kwargs)
+
+    # The entity must already be out of the store and space
+    def release(self, entity):
+        self.free.append(entity)
+
+    def __len__(self):
+        return len(self.free)
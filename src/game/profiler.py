@@ -0,0 +1,147 @@
+import csv
+import json
+import numpy
+
+from timeit import default_timer
+
+# Times named zones of every frame, keeping the last frames in a ring
+# buffer. Zones are timed with
+#
+#     with profiler.zone('physics'):
+#         space.step(dt)
+#
+# and add up when entered more than once a frame. frame() closes the
+# current frame, which is also timed as a whole. A disabled profiler hands
+# out a zone that does nothing
+class FrameProfiler(object):
+
+    FRAMES = 600
+    ZONES = 16
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, frames=FRAMES, enabled=True, *args, **kwargs):
+        self.enabled = enabled
+        # zone names in the order their columns were added
+        self.names = []
+        self.columns = {}
+        self.zones = {}
+        self.current = []
+        # milliseconds per frame for each zone, and for the whole frame
+        self.times = numpy.zeros((frames, FrameProfiler.ZONES))
+        self.frame_times = numpy.zeros(frames)
+        # frames recorded, the newest is at (count - 1) % frames
+        self.count = 0
+        self.last_frame = default_timer()
+
+    def zone(self, name):
+        if not self.enabled:
+            return NULL_ZONE
+        if name not in self.zones:
+            self.zones[name] = Zone(self, self.column(name))
+        return self.zones[name]
+
+    def column(self, name):
+        if name not in self.columns:
+            if len(self.names) == self.times.shape[1]:
+                self.times = numpy.hstack((self.times, numpy.zeros_like(self.times)))
+            self.columns[name] = len(self.names)
+            self.names.append(name)
+            self.current.append(0.0)
+        return self.columns[name]
+
+    def frame(self):
+        now = default_timer()
+        if self.enabled:
+            row = self.count % len(self.frame_times)
+            self.times[row, :len(self.current)] = self.current
+            self.frame_times[row] = (now - self.last_frame) * 1000
+            self.count += 1
+            self.current[:] = [0.0] * len(self.current)
+        self.last_frame = now
+
+    def clear(self):
+        self.count = 0
+        self.current[:] = [0.0] * len(self.current)
+        self.last_frame = default_timer()
+
+    # Recorded frames, oldest first, as (frame times, zone times by column)
+    def history(self):
+        size = len(self.frame_times)
+        if self.count <= size:
+            order = numpy.arange(self.count)
+        else:
+            order = numpy.arange(self.count, self.count + size) % size
+        return self.frame_times[order], self.times[order, :len(self.names)]
+
+    # Percentiles, mean and max of each zone and the whole frame in ms
+    def summary(self):
+        frame_times, times = self.history()
+        columns = [('frame', frame_times)]
+        columns.extend((name, times[:, i]) for i, name in enumerate(self.names))
+
+        summary = {}
+        for name, values in columns:
+            if len(values) == 0:
+                continue
+            stats = {}
+            for p in FrameProfiler.PERCENTILES:
+                stats['p%d' % p] = float(numpy.percentile(values, p))
+            stats['mean'] = float(values.mean())
+            stats['max'] = float(values.max())
+            summary[name] = stats
+        return summary
+
+    def export_json(self, path):
+        frame_times, times = self.history()
+        frames = []
+        for frame_time, row in zip(frame_times, times):
+            frame = {'frame': float(frame_time)}
+            frame.update(zip(self.names, map(float, row)))
+            frames.append(frame)
+        with open(path, 'w') as f:
+            json.dump({
+                'zones': self.names,
+                'frames': frames,
+                'summary': self.summary()
+                }, f, indent = 1)
+
+    # One row per frame, then one row per statistic named in the first column
+    def export_csv(self, path):
+        frame_times, times = self.history()
+        columns = ['frame'] + self.names
+        summary = self.summary()
+        with open(path, 'wb') as f:
+            writer = csv.writer(f)
+            writer.writerow(['index'] + columns)
+            for i, (frame_time, row) in enumerate(zip(frame_times, times)):
+                writer.writerow([i, frame_time] + list(row))
+            if summary:
+                for stat in sorted(summary['frame']):
+                    writer.writerow([stat] + [summary[name][stat] for name in columns])
+
+# Adds the time spent inside it to its column of the current frame
+class Zone(object):
+
+    def __init__(self, profiler, column, *args, **kwargs):
+        self.profiler = profiler
+        self.column = column
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = default_timer()
+
+    def __exit__(self, *exc):
+        self.profiler.current[self.column] += (default_timer() - self.start) * 1000
+        return False
+
+# Zone of a disabled profiler
+class NullZone(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_ZONE = NullZone()
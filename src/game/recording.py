@@ -0,0 +1,107 @@
+import struct
+
+# What a player asked their bro to do
+class Action(object):
+    JUMP = 0
+    MOVE_LEFT = 1
+    MOVE_RIGHT = 2
+    STOP_LEFT = 3
+    STOP_RIGHT = 4
+    FREEZE = 5
+    # marks the last tick of a run
+    END = 255
+
+# Streams the actions of every player to a file as they happen. Input logs
+# are a stream of runs, each a header with the seed it was played with,
+# then the actions taken, stamped with the physics tick they came before,
+# and an END action on the tick the run stopped
+class InputRecorder(object):
+
+    MAGIC = b'SBBR'
+    RUN = struct.Struct('<4sq')
+    EVENT = struct.Struct('<IBB')
+
+    def __init__(self, path, *args, **kwargs):
+        self.file = open(path, 'wb')
+        self.running = False
+
+    def begin(self, seed):
+        if self.running:
+            self.end(self.tick)
+        self.file.write(InputRecorder.RUN.pack(InputRecorder.MAGIC, seed))
+        self.running = True
+        self.tick = 0
+
+    def record(self, tick, player, action):
+        self.file.write(InputRecorder.EVENT.pack(tick, player, action))
+        self.tick = tick
+
+    def end(self, tick):
+        if self.running:
+            self.record(tick, 0, Action.END)
+            self.running = False
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+# One recorded run, fed back into a Simulation one tick at a time
+class Playback(object):
+
+    def __init__(self, seed, events, end=None, *args, **kwargs):
+        self.seed = seed
+        # (tick, player, action) in tick order
+        self.events = events
+        # tick the run stopped on, None if the log was cut short
+        self.end = end
+        self.position = 0
+
+    def rewind(self):
+        self.position = 0
+
+    # Apply the actions taken before the simulation's next step
+    def feed(self, simulation):
+        events = self.events
+        while self.position < len(events) and events[self.position][0] <= simulation.ticks:
+            tick, player, action = events[self.position]
+            simulation.control(player, action)
+            self.position += 1
+
+    def finished(self, simulation):
+        return simulation.ticks >= self.length()
+
+    # Ticks in the run, up to the last action when the log was cut short
+    def length(self):
+        if self.end is not None:
+            return self.end
+        if self.events:
+            return self.events[-1][0] + 1
+        return 0
+
+    # Every run in an input log
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        run = InputRecorder.RUN
+        event = InputRecorder.EVENT
+        runs = []
+        offset = 0
+        while offset + run.size <= len(data):
+            magic, seed = run.unpack_from(data, offset)
+            if magic != InputRecorder.MAGIC:
+                raise ValueError("%s is not an input log" % path)
+            offset += run.size
+
+            events = []
+            end = None
+            while offset + event.size <= len(data):
+                tick, player, action = event.unpack_from(data, offset)
+                offset += event.size
+                if action == Action.END:
+                    end = tick
+                    break
+                events.append((tick, player, action))
+            runs.append(Playback(seed, events, end))
+        return runs
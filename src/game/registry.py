@@ -0,0 +1,38 @@
+# Unordered collection with constant time add and remove. Removing an item
+# swaps the last one into its slot, iteration runs from the back so the
+# current item can be removed while looping
+class Registry(object):
+
+    def __init__(self, items=(), *args, **kwargs):
+        self.items = []
+        self.index = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        self.index[item] = len(self.items)
+        self.items.append(item)
+
+    def remove(self, item):
+        slot = self.index.pop(item)
+        last = self.items.pop()
+        if last is not item:
+            self.items[slot] = last
+            self.index[last] = slot
+
+    def __contains__(self, item):
+        return item in self.index
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, slot):
+        return self.items[slot]
+
+    def __iter__(self):
+        items = self.items
+        slot = len(items) - 1
+        while slot >= 0:
+            if slot < len(items):
+                yield items[slot]
+            slot -= 1
@@ -0,0 +1,381 @@
+import numpy
+import pyglet
+import rabbyt
+from pyglet.gl import GL_QUADS
+
+from drawlist import DrawList
+
+# Draws the tiles of the sections it is given with one pyglet batch. Each
+# section owns a contiguous run of quads in the batch. Given only the
+# sections on screen, neither the draw nor the upload cost grows with the
+# number of live sections
+class TileRenderer(object):
+
+    def __init__(self, texture, *args, **kwargs):
+        texture = texture.get_texture()
+        self.batch = pyglet.graphics.Batch()
+        self.group = pyglet.graphics.TextureGroup(texture)
+        self.tex_coords = tuple(texture.tex_coords)
+        self.meshes = {}
+
+    # Build meshes for sections coming into view, free those of sections
+    # that left it and upload any tiles that changed since the last frame
+    def update(self, sections):
+        current = set(sections)
+        for section in current:
+            if section not in self.meshes:
+                self.meshes[section] = SectionMesh(self, section)
+        for section in list(self.meshes):
+            if section not in current:
+                self.meshes.pop(section).delete()
+
+        for mesh in self.meshes.values():
+            mesh.update()
+
+    def draw(self):
+        self.batch.draw()
+
+# The quads for one Section's tiles. Static tiles are written once, after
+# that only recoloured, falling or removed tiles are uploaded again
+class SectionMesh(object):
+
+    VERTS_PER_TILE = 4
+
+    def __init__(self, renderer, section, *args, **kwargs):
+        self.tiles = list(section.tiles)
+        # tiles that dropped while the section was out of view move already
+        self.moving = set(tile for tile in self.tiles if not tile.static)
+
+        count = len(self.tiles) * SectionMesh.VERTS_PER_TILE
+        for i, tile in enumerate(self.tiles):
+            tile.mesh = self
+            tile.mesh_index = i
+        vertices, colors = DrawList.tiles(self.tiles)
+
+        self.vertex_list = renderer.batch.add(count, GL_QUADS, renderer.group,
+                ('v2f/dynamic', vertices),
+                ('c4f/dynamic', colors),
+                ('t3f/static', renderer.tex_coords * len(self.tiles)))
+
+    def update(self):
+        for tile in self.moving:
+            self.write('vertices', tile, DrawList.quad(tile))
+
+    def recolor(self, tile):
+        self.write('colors', tile, DrawList.color(tile))
+
+    # Tile is no longer static, upload its position every frame
+    def release(self, tile):
+        self.moving.add(tile)
+
+    def hide(self, tile):
+        self.moving.discard(tile)
+        self.write('vertices', tile, (0, 0) * SectionMesh.VERTS_PER_TILE)
+
+    def delete(self):
+        for tile in self.tiles:
+            # pooled tiles may already belong to a newer section
+            if tile.mesh is self:
+                tile.mesh = None
+        self.vertex_list.delete()
+
+    # Overwrite the vertices of a single tile, marking only them for upload
+    def write(self, name, tile, data):
+        vertex_list = self.vertex_list
+        attribute = vertex_list.domain.attribute_names[name]
+        start = vertex_list.start + tile.mesh_index * SectionMesh.VERTS_PER_TILE
+        region = attribute.get_region(attribute.buffer, start, SectionMesh.VERTS_PER_TILE)
+        region.array[:] = data
+        region.invalidate()
+
+# A tileable texture repeated over the camera's view as one cached quad.
+# The quad is drawn in world space with the rest of the camera pass, tiling
+# at the texture's size in pixels of the draw area. Parallax only moves the
+# texture coordinates, by a fraction of the camera's movement
+class BackgroundRenderer(object):
+
+    # How far the background moves for each unit the camera does
+    PARALLAX = 0.25
+
+    def __init__(self, texture, parallax=PARALLAX, *args, **kwargs):
+        self.texture = texture
+        self.parallax = parallax
+        self.batch = pyglet.graphics.Batch()
+        self.group = pyglet.graphics.TextureGroup(texture)
+        self.vertex_list = self.batch.add(4, GL_QUADS, self.group,
+                'v2f/dynamic',
+                't3f/dynamic')
+        self.width = 0
+        self.height = 0
+        self.camera = None
+
+    # Size of the draw area in pixels, the texture repeats every
+    # texture.width by texture.height of them
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+        self.camera = None
+
+    # Place the quad over the camera's view, only when it moved
+    def follow(self, camera):
+        if camera == self.camera:
+            return
+        self.camera = camera
+        left, top, right, bottom = camera
+        self.vertex_list.vertices[:] = (left, bottom, right, bottom, right, top, left, top)
+
+        # camera units to draw area pixels
+        scale = self.width / float(right - left)
+        u1 = left * scale * self.parallax / self.texture.width
+        u2 = u1 + float(self.width) / self.texture.width
+        v2 = float(self.height) / self.texture.height
+        self.vertex_list.tex_coords[:] = (u1, 0, 0, u2, 0, 0, u2, v2, 0, u1, v2, 0)
+
+    def draw(self):
+        self.batch.draw()
+
+# Draws every entity of one kind between the left and right edges given,
+# straight from the EntityStore arrays. All quads are computed with numpy
+# and uploaded as a single vertex list
+class EntityRenderer(object):
+
+    CAPACITY = 16
+
+    def __init__(self, texture, store, kind, size, *args, **kwargs):
+        texture = texture.get_texture()
+        self.store = store
+        self.kind = kind
+        self.half_size = size / 2.0
+        self.tex_coords = tuple(texture.tex_coords)
+        self.batch = pyglet.graphics.Batch()
+        self.group = pyglet.graphics.TextureGroup(texture)
+        self.capacity = 0
+        self.vertex_list = None
+        self._allocate(EntityRenderer.CAPACITY)
+
+    def _allocate(self, capacity):
+        if self.vertex_list is not None:
+            self.vertex_list.delete()
+        self.capacity = capacity
+        self.vertex_list = self.batch.add(capacity * 4, GL_QUADS, self.group,
+                'v2f/stream',
+                'c4f/stream',
+                ('t3f/static', self.tex_coords * capacity))
+
+    def update(self, left, right):
+        store = self.store
+        slots = DrawList.visible(store, store.slots(self.kind), left, right, self.half_size)
+        count = len(slots)
+        if count > self.capacity:
+            self._allocate(max(count, self.capacity * 2))
+
+        vertices, colors = DrawList.entities(store, slots, self.half_size, self.capacity)
+        numpy.ctypeslib.as_array(self.vertex_list.vertices)[:] = vertices.ravel()
+        numpy.ctypeslib.as_array(self.vertex_list.colors)[:] = colors.ravel()
+
+    def draw(self):
+        self.batch.draw()
+
+# Numbers drawn from the font's cached glyph atlas, every ScoreLabel of the
+# renderer in one batch so they draw together in a single call
+class ScoreRenderer(object):
+
+    CHARACTERS = '-0123456789'
+
+    def __init__(self, font_size, bold=True, font_name=None, *args, **kwargs):
+        font = pyglet.font.load(font_name, font_size, bold=bold)
+        glyphs = font.get_glyphs(ScoreRenderer.CHARACTERS)
+        self.glyphs = dict(zip(ScoreRenderer.CHARACTERS, glyphs))
+        self.batch = pyglet.graphics.Batch()
+        # a handful of glyphs for a fresh font all fit in its first texture
+        self.group = pyglet.graphics.TextureGroup(glyphs[0].owner)
+
+    def label(self, value=0, x=0, y=0, color=(255, 255, 255, 255)):
+        return ScoreLabel(self, value, x, y, color)
+
+    def draw(self):
+        self.batch.draw()
+
+# One number of a ScoreRenderer. Its quads are only laid out again when the
+# value or position changes and only recoloured when the colour does
+class ScoreLabel(object):
+
+    VERTS_PER_GLYPH = 4
+    # glyphs allocated for a new label
+    CAPACITY = 6
+
+    def __init__(self, renderer, value=0, x=0, y=0, color=(255, 255, 255, 255), *args, **kwargs):
+        self.renderer = renderer
+        self.x = x
+        self.y = y
+        self.color = tuple(color)
+        self.value = None
+        self.capacity = 0
+        self.vertex_list = None
+        self.set(value)
+
+    def _allocate(self, capacity):
+        if self.vertex_list is not None:
+            self.vertex_list.delete()
+        self.capacity = capacity
+        count = capacity * ScoreLabel.VERTS_PER_GLYPH
+        self.vertex_list = self.renderer.batch.add(count, GL_QUADS, self.renderer.group,
+                'v2f/dynamic',
+                't3f/dynamic',
+                ('c4B/dynamic', self.color * count))
+
+    def set(self, value):
+        if value != self.value:
+            self.value = value
+            self.layout()
+
+    def move(self, x, y):
+        if (x, y) != (self.x, self.y):
+            self.x = x
+            self.y = y
+            self.layout()
+
+    def recolor(self, color):
+        color = tuple(color)
+        if color != self.color:
+            self.color = color
+            self.vertex_list.colors[:] = color * (self.capacity * ScoreLabel.VERTS_PER_GLYPH)
+
+    def layout(self):
+        text = str(self.value)
+        if len(text) > self.capacity:
+            self._allocate(max(len(text), self.capacity * 2, ScoreLabel.CAPACITY))
+
+        vertices = []
+        tex_coords = []
+        x = self.x
+        y = self.y
+        for character in text:
+            glyph = self.renderer.glyphs[character]
+            x1, y1, x2, y2 = glyph.vertices
+            vertices.extend((x + x1, y + y1, x + x2, y + y1, x + x2, y + y2, x + x1, y + y2))
+            tex_coords.extend(glyph.tex_coords)
+            x += glyph.advance
+        # unused glyphs collapse to nothing
+        unused = (self.capacity - len(text)) * ScoreLabel.VERTS_PER_GLYPH
+        vertices.extend((0, 0) * unused)
+        tex_coords.extend((0, 0, 0) * unused)
+        self.vertex_list.vertices[:] = vertices
+        self.vertex_list.tex_coords[:] = tex_coords
+
+    def delete(self):
+        self.vertex_list.delete()
+
+# Stacked bars of the time each profiler zone took over the last frames,
+# drawn in window pixels with a line at the frame budget
+class ProfilerGraph(object):
+
+    FRAMES = 120
+    BAR_WIDTH = 2
+    # pixels per millisecond
+    SCALE = 4
+    BUDGET = 1000.0 / 60
+
+    COLORS = [
+            (0.9, 0.3, 0.3, 0.8),
+            (0.3, 0.6, 0.9, 0.8),
+            (0.9, 0.8, 0.2, 0.8),
+            (0.4, 0.8, 0.4, 0.8),
+            (0.8, 0.4, 0.9, 0.8),
+            (0.9, 0.6, 0.2, 0.8),
+            (0.3, 0.9, 0.9, 0.8),
+            (0.7, 0.7, 0.7, 0.8),
+            ]
+
+    def __init__(self, profiler, x=0, y=0, *args, **kwargs):
+        self.profiler = profiler
+        self.x = x
+        self.y = y
+        self.batch = pyglet.graphics.Batch()
+        self.vertex_list = None
+        self.zones = 0
+        width = ProfilerGraph.FRAMES * ProfilerGraph.BAR_WIDTH
+        top = y + ProfilerGraph.BUDGET * ProfilerGraph.SCALE
+        self.budget_line = self.batch.add(2, pyglet.gl.GL_LINES, None,
+                ('v2f/static', (x, top, x + width, top)),
+                ('c4f/static', (1, 1, 1, 0.8) * 2))
+
+    def _allocate(self, zones):
+        if self.vertex_list is not None:
+            self.vertex_list.delete()
+        self.zones = zones
+        count = ProfilerGraph.FRAMES * zones
+        colors = numpy.array([ProfilerGraph.COLORS[i % len(ProfilerGraph.COLORS)]
+            for i in range(zones)], dtype=numpy.float32)
+        colors = numpy.tile(colors[None, :, None, :], (ProfilerGraph.FRAMES, 1, 4, 1))
+        self.vertex_list = self.batch.add(count * 4, GL_QUADS, None,
+                'v2f/stream',
+                ('c4f/static', colors.ravel().tolist()))
+
+    def update(self):
+        profiler = self.profiler
+        zones = len(profiler.names)
+        if zones == 0:
+            return
+        if zones != self.zones:
+            self._allocate(zones)
+
+        frame_times, times = profiler.history()
+        times = times[-ProfilerGraph.FRAMES:]
+        # bars are right aligned so the newest frame is always at the end
+        frames = numpy.zeros((ProfilerGraph.FRAMES, zones))
+        frames[ProfilerGraph.FRAMES - len(times):] = times
+
+        top = self.y + numpy.cumsum(frames, axis=1) * ProfilerGraph.SCALE
+        bottom = top - frames * ProfilerGraph.SCALE
+        left = self.x + numpy.arange(ProfilerGraph.FRAMES)[:, None] * ProfilerGraph.BAR_WIDTH
+        left = numpy.broadcast_to(left, top.shape)
+        right = left + ProfilerGraph.BAR_WIDTH
+
+        vertices = numpy.empty((ProfilerGraph.FRAMES, zones, 4, 2), dtype=numpy.float32)
+        vertices[:, :, 0] = numpy.stack((left, bottom), axis=-1)
+        vertices[:, :, 1] = numpy.stack((right, bottom), axis=-1)
+        vertices[:, :, 2] = numpy.stack((right, top), axis=-1)
+        vertices[:, :, 3] = numpy.stack((left, top), axis=-1)
+        numpy.ctypeslib.as_array(self.vertex_list.vertices)[:] = vertices.ravel()
+
+    def draw(self):
+        self.update()
+        self.batch.draw()
+
+# The draws of one frame grouped by the viewport and projection they need,
+# so the viewport is set once per pass rather than once per draw. Draws
+# keep the order they were added in within a pass and passes the order
+# they were first used in. The clear is skipped when an opaque layer
+# covers the whole window
+class RenderPlan(object):
+
+    def __init__(self, *args, **kwargs):
+        self.passes = []
+        self.size = (0, 0)
+        self.covered = False
+
+    def begin(self, width, height):
+        del self.passes[:]
+        self.size = (width, height)
+        self.covered = False
+
+    # Something opaque is drawn over this much of the window from its corner
+    def cover(self, width, height):
+        if width >= self.size[0] and height >= self.size[1]:
+            self.covered = True
+
+    def add(self, viewport, projection, draw):
+        for pass_viewport, pass_projection, draws in self.passes:
+            if pass_viewport == viewport and pass_projection == projection:
+                draws.append(draw)
+                return
+        self.passes.append((viewport, projection, [draw]))
+
+    def execute(self):
+        if not self.covered:
+            rabbyt.clear()
+        for viewport, projection, draws in self.passes:
+            rabbyt.set_viewport(viewport, projection=projection)
+            for draw in draws:
+                draw()
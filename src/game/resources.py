@@ -1,8 +1,16 @@
-import pyglet
+import options
 
-pyglet.resource.path = ['../res']
-pyglet.resource.reindex()
+# Textures need an OpenGL context, headless runs go without
+if options.HEADLESS:
+    box = None
+    checkpoint = None
+    background = None
+else:
+    import pyglet
 
-box = pyglet.resource.image("box.png")
-checkpoint = pyglet.resource.image("checkpoint.png")
-background = pyglet.resource.image("background.png")
+    pyglet.resource.path = ['../res']
+    pyglet.resource.reindex()
+
+    box = pyglet.resource.image("box.png")
+    checkpoint = pyglet.resource.image("checkpoint.png")
+    background = pyglet.resource.image("background.png")
@@ -1,18 +1,21 @@
 import pyglet
-import pymunk
 import rabbyt
 
-import color
+import options
 import resources
-from player import Player
-from tile import Tile
+from simulation import Simulation
+from recording import Action, InputRecorder
+from loop import FixedStepLoop
+from render import TileRenderer, EntityRenderer, BackgroundRenderer, ScoreRenderer
 from bro import Bro
-from section import Section
 
 from OpenGL.GL import *
-from collections import deque
 
 class Scene(object):
+
+    # FrameProfiler timing the scene, if it has one
+    profiler = None
+
     def __init__(self, game, *args, **kwargs):
         self.game = game
 
@@ -32,6 +35,10 @@ class Scene(object):
     def on_draw(self):
         pass
 
+    # Add the scene's draws to the frame's RenderPlan
+    def plan(self, plan):
+        plan.add(self.game.get_size(), self.game.projection, self.on_draw)
+
     def on_key_pressed(self, symbol, modifiers):
         pass
 
@@ -45,25 +52,6 @@ class GameScene(Scene):
 
     BACKGROUND = pyglet.image.TileableTexture.create_for_image(resources.background)
 
-    COLORS = (color.RED, color.BLUE, color.YELLOW)
-
-    GRAVITY = (0.0, -500.0)
-    PHYSICS_FRAMERATE = 1.0 / 80
-
-    DEATH_Y = -80
-
-    SCROLL_RATE = 10
-    SCROLL_ACCL = 0.4
-    SCROLL_DELAY = 2
-    DROP_LINE_START = -150
-
-    START_PROJECTION_X = -200
-    START_PROJECTION_Y = -32
-
-    # Logical game size
-    GAME_WIDTH = 900
-    GAME_HEIGHT = 480
-
     SCORE_ALIVE_ALPHA =  255
     SCORE_DEAD_ALPHA = int(0.5 * 255)
     SCORE_SIZE = 36
@@ -71,8 +59,6 @@ class GameScene(Scene):
     SCORE_SPACING = 1.0 / 3
     SCORE_Y_OFFSET = 100
 
-    POPULATE_PADDING = 50
-
     KEY_BINDINGS = {
             0: {
                 'left': pyglet.window.key.LEFT,
@@ -96,75 +82,70 @@ class GameScene(Scene):
 
     def __init__(self, game, *args, **kwargs):
         super(GameScene, self).__init__(game, *args, **kwargs)
+        # Kept across resets so restarting reuses the world's entities
+        self.simulation = self.create_simulation()
+
+    def create_simulation(self):
+        recorder = None
+        if options.RECORD:
+            recorder = InputRecorder(options.RECORD)
+        return Simulation(recorder=recorder)
 
     def start(self):
-        # Create players
-        self.players = []
+        # Start the game world
+        self.simulation.start()
+
+        # Tiles are drawn per section, bros straight from the entity store
+        self.tile_renderer = TileRenderer(resources.box)
+        self.bro_renderer = EntityRenderer(resources.box, self.simulation.store, Bro.KIND, Bro.SIZE)
+        self.background = BackgroundRenderer(GameScene.BACKGROUND)
+        self.layout()
+
+        # every score is drawn from one glyph atlas in one batch
+        self.score_renderer = ScoreRenderer(GameScene.SCORE_SIZE, bold = True)
         self.score_labels = []
-        for i, color in enumerate(GameScene.COLORS):
-            player = Player(color)
-            self.players.append(player)
+        for i, player in enumerate(self.simulation.players):
             # player input handlers
             keys = GameScene.KEY_BINDINGS[i]
-            player.input_handler = self.create_input_handler(player, 
+            player.input_handler = self.create_input_handler(i, 
                     jump = keys['jump'],
                     left = keys['left'],
                     right = keys['right'],
                     freeze = keys['freeze'])
             # Score Labels
-            label_color = color.tup() + (GameScene.SCORE_ALIVE_ALPHA,)
-            label = pyglet.text.Label('0', 
-                        font_size = GameScene.SCORE_SIZE,
-                        bold = True,
-                        color = label_color)
+            label_color = player.color.tup() + (GameScene.SCORE_ALIVE_ALPHA,)
+            label = self.score_renderer.label(0, color = label_color)
             self.score_labels.append(label)
             player.score_label = label
+            player.score_label_alive = True
         self.position_labels()
 
-        # Create physics space
-        self.space = pymunk.Space()
-        # Instantly correct collisions
-        #self.space.collision_bias = 0
-        self.space.gravity = GameScene.GRAVITY
-        Bro.setup_collision_handlers(self.space)
+        # Physics and game rules advance together in fixed steps
+        self.loop = FixedStepLoop(self.simulation.step, Simulation.PHYSICS_FRAMERATE)
 
-        # Create first section
-        self.entities = []
-        self.sections = deque()
-        self.current_distance = 0
-        self.push_section()
+        # Schedule updating game
+        pyglet.clock.schedule(rabbyt.add_time)
+        pyglet.clock.schedule(self.update)
 
-        # Create entities
-        self.bros = []
-        for i, player in enumerate(self.players):
-            self.add_bro(player, y=(i+2)*50)
+    @property
+    def players(self):
+        return self.simulation.players
 
-        # slowly panning camera
-        self.camera = self.start_projection()
+    @property
+    def entities(self):
+        return self.simulation.entities
 
-        # Game state
-        self.scroll_delay = GameScene.SCROLL_DELAY
-        self.scroll_rate =  GameScene.SCROLL_RATE
-        self.drop_line = GameScene.DROP_LINE_START
+    @property
+    def camera(self):
+        return self.simulation.camera
 
-        # Schedule updating game
-        pyglet.clock.schedule(rabbyt.add_time)
-        pyglet.clock.schedule(self.update)
-        pyglet.clock.schedule_interval(self.update_physics, GameScene.PHYSICS_FRAMERATE)
-
-    def start_projection(self):
-        left = GameScene.START_PROJECTION_X
-        bottom = GameScene.START_PROJECTION_Y
-        width = GameScene.GAME_WIDTH    
-        height = GameScene.GAME_HEIGHT
-        right = width + left
-        top = height + bottom
-        #print(float(width) / height)
-        return (left, top, right, bottom)
+    @property
+    def profiler(self):
+        return self.simulation.profiler
     
     def draw_area(self):
         window_ratio = float(self.game.width) / self.game.height
-        game_ratio = float(GameScene.GAME_WIDTH) / GameScene.GAME_HEIGHT
+        game_ratio = float(Simulation.GAME_WIDTH) / Simulation.GAME_HEIGHT
         #print("g: %s, w: %s" % (game_ratio, window_ratio))
         # limited by height
         if window_ratio > game_ratio:
@@ -184,122 +165,72 @@ class GameScene(Scene):
         #return (left, top, right, bottom)
         return (width, height)
 
+    # The draw area only changes with the window, work it out and size the
+    # background once per change
+    def layout(self):
+        self.area = self.draw_area()
+        self.background.resize(*self.area)
+
     def position_labels(self):
         for i, label in enumerate(self.score_labels):
-            label.x = i * GameScene.SCORE_SPACING * self.game.width + GameScene.SCORE_OFFSET
-            label.y = self.game.height - GameScene.SCORE_Y_OFFSET
+            label.move(i * GameScene.SCORE_SPACING * self.game.width + GameScene.SCORE_OFFSET,
+                    self.game.height - GameScene.SCORE_Y_OFFSET)
 
     def stop(self):
         pyglet.clock.unschedule(rabbyt.add_time)
         pyglet.clock.unschedule(self.update)
-        pyglet.clock.unschedule(self.update_physics)
+        self.simulation.stop()
 
     def end(self):
         print("The game is over we should move to a final score screen")
         self.reset()
 
     def update(self, dt):
+        # the last frame's update and draw are done
+        self.profiler.frame()
+
+        alpha = self.loop.advance(dt)
+        with self.profiler.zone('render_update'):
+            self.simulation.interpolate(alpha)
+            # only what the camera can see is drawn
+            camera = self.camera
+            self.tile_renderer.update(self.simulation.visible_sections())
+            self.bro_renderer.update(camera[0], camera[2])
+            self.background.follow(camera)
 
-        # Scroll the game and camera
-        self.scroll(dt)
-
-        # update entities
-        for entity in self.entities:
-            entity.update(dt)
-
-        # Kill bros that have fallen
-        for bro in self.bros:
-            if bro.y < GameScene.DEATH_Y:
-                self.kill_bro(bro)
-            elif bro.x < self.drop_line:
-                bro.drop()
-
-        for tile in self.sections[0].tiles:
-            # Remove fallen tiles
-            if tile.y < GameScene.DEATH_Y:
-                self.sections[0].tiles.remove(tile)
-                self.entities.remove(tile)
-            # Drop tiles behind drop line
-            elif tile.x < self.drop_line:
-                pass
-                #tile.drop()
-
-        # delete empty sections
-        if len(self.sections[0].active_tiles()) == 0:
-            self.pop_section()
-
-        # update score labels
         for player, label in zip(self.players, self.score_labels):
-            label.text = str(player.distance)
-
-        # add sections 
-        while self.current_distance * Tile.SIZE < self.populate_distance():
-            self.push_section()
-
-    def scroll(self, dt):
-        # Scroll viewport or decrement scroll delay
-        if self.scroll_delay > 0:
-            self.scroll_delay -= dt
-            dscroll = max(0, dt - self.scroll_delay)
-        else:
-            dscroll = dt
-
-        # Accelerate scrolling
-        self.scroll_rate += GameScene.SCROLL_ACCL * dscroll
-
-        # move camera projection
-        dcamera = GameScene.get_scroll(dscroll, self.scroll_rate) 
-        self.camera = GameScene.addt(self.camera, dcamera)
-
-        # move line that drops entities
-        self.drop_line += dscroll * self.scroll_rate
-
-    # Add tuple element-wise
-    @staticmethod
-    def addt(a, b):
-        return (map(sum,zip(a,b)))
-
-    @staticmethod
-    def get_scroll(dt, rate):
-        return (map(lambda x: x * rate * dt, (1, 0, 1, 0)))
-
-    def update_physics(self, dt):
-        self.space.step(dt)
-
-    def camera_distance(self):
-        return self.camera[2]
+            # Change label color once the player has no bro left
+            alive = player.active_bro() is not None
+            if alive != player.score_label_alive:
+                player.score_label_alive = alive
+                label_alpha = GameScene.SCORE_ALIVE_ALPHA if alive else GameScene.SCORE_DEAD_ALPHA
+                label.recolor(player.color.tup() + (label_alpha,))
+            # only laid out again when the distance changed
+            label.set(player.distance)
+
+        if self.simulation.over:
+            self.end()
 
-    def populate_distance(self):
-        return self.camera_distance() + GameScene.POPULATE_PADDING
+    # Key presses become actions of the player with this index, going
+    # through the simulation so they can be recorded
+    def create_input_handler(self, index, left, right, jump, freeze):
+        pressed_actions = {
+                jump: Action.JUMP,
+                left: Action.MOVE_LEFT,
+                right: Action.MOVE_RIGHT,
+                freeze: Action.FREEZE
+                }
+        released_actions = {
+                left: Action.STOP_LEFT,
+                right: Action.STOP_RIGHT
+                }
 
-    def create_input_handler(self, player, left, right, jump, freeze):
         def input_handler(pressed, symbol, modifiers):
-            # See if there is a bro to use the input
-            bro = player.active_bro()
-            if bro:
-                # If the key was pressed
-                if pressed:
-                    if symbol == jump:
-                        bro.jump()
-                        return True
-                    elif symbol == left:
-                        bro.move_left()
-                        return True
-                    elif symbol == right:
-                        bro.move_right()
-                        return True
-                    elif symbol == freeze:
-                        self.freeze_bro(bro)
-                        return True
-                # else released key
-                else:
-                    if symbol == left:
-                        bro.stop_left()
-                        return True
-                    elif symbol == right:
-                        bro.stop_right()
-                        return True
-           # fall through if we did not handle the input
+            actions = pressed_actions if pressed else released_actions
+            if symbol in actions:
+                # handled if there is a bro to use the input
+                return self.simulation.control(index, actions[symbol])
+            # fall through if we did not handle the input
             return False
 
         return input_handler
@@ -308,83 +239,77 @@ class GameScene(Scene):
         p = self.players[0]
         return p.active_bro()
 
-    def add_bro(self, player, old_bro=None, x=0, y=100):
-        #x = self.sections[0].first_tile_offset()
-        if old_bro is not None:
-            x = old_bro.last_tile.x
-            y = old_bro.last_tile.y + Tile.SIZE
-        bro = Bro(player, self.space, x=x, y=y, old_bro=old_bro)
-        self.entities.append(bro)
-        self.bros.append(bro)
-
-    def kill_bro(self, bro):
-        self.entities.remove(bro)
-        self.bros.remove(bro)
-        if bro.alive():
-            bro.die()
-            # Change label color
-            player = bro.player
-            player.score_label.color = player.color.tup() + (GameScene.SCORE_DEAD_ALPHA,)
-        # Check if this was the last bro standing
-        if not self.bros_remaining():
-            self.end()
+    # The background and the world share the camera's projection, the
+    # score labels go in the window's pass with the rest of the overlay
+    def plan(self, plan):
+        # the background has no transparency and fills the draw area
+        plan.cover(*self.area)
+        plan.add(self.area, self.camera, self.draw_world)
+        plan.add(self.game.get_size(), self.game.projection, self.draw_hud)
+
+    def draw_world(self):
+        profiler = self.profiler
+        with profiler.zone('draw_background'):
+            # reset opengl draw colour
+            glColor(255, 255, 255, 1)
+            self.background.draw()
+
+        with profiler.zone('draw_world'):
+            self.tile_renderer.draw()
+            self.bro_renderer.draw()
+
+    def draw_hud(self):
+        with self.profiler.zone('draw_hud'):
+            self.score_renderer.draw()
 
-    def bros_remaining(self):
+    def on_key_press(self, symbol, modifiers):
         for player in self.players:
-            if player.active_bro() is not None:
-                return True
-        return False
+            if player.input_handler(True, symbol, modifiers): break
 
-    def freeze_bro(self, bro):
-        # Prevent us from freezing if there is not last tile or the tile has dropped
-        if bro.last_tile is not None and bro.last_tile.static:
-            self.add_bro(bro.player, old_bro=bro)
-            bro.freeze()
+    def on_key_release(self, symbol, modifiers):
+        for player in self.players:
+            if player.input_handler(False, symbol, modifiers): break
 
-    def push_section(self):
-        section = Section(self.current_distance, self.space)
-        self.sections.append(section)
-        self.entities += section.tiles
-        self.current_distance += section.length
+    def on_resize(self, width, height):
+        self.layout()
+        self.position_labels()
 
-    def pop_section(self):
-        section = self.sections.popleft()
-        for tile in section.tiles:
-            self.entities.remove(tile)
-            self.space.remove(tile.pymunk_shape)
+# Plays recorded runs back one after another, speed times faster than they
+# were played. The keyboard is ignored
+class ReplayScene(GameScene):
 
-    def remove_section(self, section):
-        self.sections.remove(section)
+    SPEED = 4
 
+    def __init__(self, game, runs, speed=SPEED, *args, **kwargs):
+        self.runs = runs
+        self.run = 0
+        self.speed = speed
+        super(ReplayScene, self).__init__(game, *args, **kwargs)
 
-    def on_draw(self):
-        draw_area = self.draw_area()
-        static_projection = (0, draw_area[1], draw_area[0], 0)
-        # Draw background
-        rabbyt.set_viewport(draw_area, projection = static_projection)
-        # reset opengl draw colour
-        glColor(255, 255, 255, 1)
-        GameScene.BACKGROUND.blit_tiled(0, 0, 0, draw_area[0], draw_area[1])
-
-        # Draw transformed sprites
-        rabbyt.set_viewport(draw_area, projection = self.camera)
-        rabbyt.render_unsorted(self.entities)
-
-        # Draw static sprites
-        rabbyt.set_viewport(draw_area, projection = static_projection)
-        for label in self.score_labels:
-            label.draw()
+    def create_simulation(self):
+        return Simulation(playback=self.runs[0])
+
+    def start(self):
+        self.simulation.playback = self.runs[self.run]
+        super(ReplayScene, self).start()
+        # let the loop catch up on the extra steps of each frame
+        self.loop = FixedStepLoop(self.simulation.step, Simulation.PHYSICS_FRAMERATE,
+                max_steps = int(FixedStepLoop.MAX_STEPS * self.speed))
+
+    def end(self):
+        self.run = (self.run + 1) % len(self.runs)
+        self.reset()
+
+    def update(self, dt):
+        super(ReplayScene, self).update(dt * self.speed)
+        if self.simulation.playback.finished(self.simulation):
+            self.end()
 
     def on_key_press(self, symbol, modifiers):
-        for player in self.players:
-            if player.input_handler(True, symbol, modifiers): break
+        pass
 
     def on_key_release(self, symbol, modifiers):
-        for player in self.players:
-            if player.input_handler(False, symbol, modifiers): break
-
-    def on_resize(self, width, height):
-        self.position_labels()
+        pass
 
 class StartScene(Scene):
     pass
@@ -1,7 +1,10 @@
 import tile
+from tilerun import TileRun
+from template import SectionTemplate, SectionLayout
+from registry import Registry
 
 import random
-from operator import attrgetter
+import bisect
 
 # A collection of Tiles with a CheckPoint at the end
 class Section(object):
@@ -79,29 +82,171 @@ class Section(object):
         ]
     ]
 
-    def __init__(self, offset, space, *args, **kwargs):
+    # Compiled once so spawning a section does no layout work
+    TEMPLATES = list(map(SectionTemplate, TILE_SETS))
+
+    # Collide neighbouring static tiles as larger rectangles
+    MERGE_SHAPES = True
+
+    # Builds the layout given or, without one, lays out a template from the
+    # library, or the built in tile sets, picked as in choose_template
+    def __init__(self, offset, space, store, rng=random, merge=MERGE_SHAPES, pool=None,
+            layout=None, library=None, index=None, difficulty=None, *args, **kwargs):
+        if layout is None:
+            template = Section.choose_template(rng, library, index, difficulty)
+            layout = SectionLayout.create(offset, template, rng)
         self.offset = offset
-        tile_set = random.choice(Section.TILE_SETS)
-        self.tiles, self.length = self.create_tiles(tile_set, space)
+        self.space = space
+        self.rng = rng
+        self.merge = merge
+        # whether static tiles are in the space
+        self.collidable = True
+        template = layout.template
+        self.length = template.length
+        tiles = self.create_tiles(layout, space, store, pool)
+        self.tiles = Registry(tiles)
+
+        # static tiles, kept up to date as tiles drop
+        self.static_tiles = Registry(tiles)
+        # static tiles in each column, first_column skips emptied columns
+        self.column_counts = list(template.column_counts)
+        self.first_column = 0
+
+        self.runs = set()
+        if merge:
+            for members, vertices in layout.rects:
+                TileRun([tiles[i] for i in members], space, self.runs, vertices)
         #self.check_point = check_point
         self.completed = False
 
-    def create_tiles(self, array, space):
+    # The template at index or, without one, a random template. Library
+    # templates are picked by weight, limited to a (low, high) difficulty
+    # range when given
+    @staticmethod
+    def choose_template(rng, library=None, index=None, difficulty=None):
+        if library is None:
+            if index is not None:
+                return Section.TEMPLATES[index]
+            return rng.choice(Section.TEMPLATES)
+        if index is not None:
+            return library.template(index)
+        low, high = difficulty if difficulty is not None else (None, None)
+        return library.choose(rng, low, high)
+
+    # Tiles come from the pool when given one
+    def create_tiles(self, layout, space, store, pool=None):
         tiles = []
-        height = len(array) - 1
-        for y, row in enumerate(array):
-            for x, val in enumerate(row):
-                if val == 1:
-                    tiles.append(tile.Tile(x + self.offset, height - y, space))
-        length = len(array[0])
-        return tiles, length
+        for (x, y), color in zip(layout.template.cells, layout.colors):
+            if pool is not None:
+                t = pool.acquire(x + self.offset, y, self.rng, self.merge, color)
+            else:
+                t = tile.Tile(x + self.offset, y, space, store, self.rng, self.merge, color)
+            t.section = self
+            tiles.append(t)
+        return tiles
+
+    def remove_tile(self, tile):
+        if tile in self.static_tiles:
+            self.release_tile(tile)
+        self.tiles.remove(tile)
+        tile.section = None
+        if tile.mesh is not None:
+            tile.mesh.hide(tile)
+
+    def remove_from_space(self):
+        if self.collidable:
+            for run in list(self.runs):
+                run.remove_from_space()
+        for tile in self.tiles:
+            # static shapes of culled sections are already out
+            if self.collidable or not tile.static:
+                tile.remove_from_space()
+
+    # Take the static collision shapes out of the space or put them back
+    def set_collidable(self, collidable):
+        if collidable != self.collidable:
+            self.collidable = collidable
+            shapes = self.static_shapes()
+            if collidable:
+                self.space.add(*shapes)
+            else:
+                self.space.remove(*shapes)
+
+    def static_shapes(self):
+        shapes = [run.pymunk_shape for run in self.runs]
+        for tile in self.static_tiles:
+            if tile.pymunk_shape is not None:
+                shapes.append(tile.pymunk_shape)
+        return shapes
+
+    # A tile stopped being static
+    def release_tile(self, tile):
+        self.static_tiles.remove(tile)
+        self.column_counts[self.column(tile)] -= 1
+        while self.first_column < self.length and self.column_counts[self.first_column] == 0:
+            self.first_column += 1
+
+    def column(self, tile):
+        return int(round(tile.x / tile.SIZE)) - self.offset
+
+    # World x range covered by the section
+    def left(self):
+        return self.offset * tile.Tile.SIZE - tile.Tile.SIZE // 2
+
+    def right(self):
+        return (self.offset + self.length) * tile.Tile.SIZE - tile.Tile.SIZE // 2
 
     def complete(self):
         self.check_point.complete = True
 
+    # x of the leftmost static tile
     def first_tile_offset(self):
-        min_tile = min(self.tiles, key = attrgetter('x'))
-        return min_tile.x
+        if self.empty():
+            return None
+        return (self.offset + self.first_column) * tile.Tile.SIZE
 
     def active_tiles(self):
-        return [tile for tile in self.tiles if tile.static]
+        return self.static_tiles
+
+    def empty(self):
+        return len(self.static_tiles) == 0
+
+# The live sections in order along x, finding those overlapping a range of
+# x with a binary search on their right edges. Sections are added on the
+# right and removed from the left as the level scrolls
+class SectionIndex(object):
+
+    def __init__(self, *args, **kwargs):
+        self.sections = []
+        self.rights = []
+        # sections before this were removed from the left
+        self.first = 0
+
+    def __len__(self):
+        return len(self.sections) - self.first
+
+    def append(self, section):
+        self.sections.append(section)
+        self.rights.append(section.right())
+
+    def popleft(self):
+        self.first += 1
+        # drop removed sections once they are half the list
+        if self.first * 2 > len(self.sections):
+            del self.sections[:self.first]
+            del self.rights[:self.first]
+            self.first = 0
+
+    def remove(self, section):
+        i = self.sections.index(section, self.first)
+        del self.sections[i]
+        del self.rights[i]
+
+    # Sections with any part between left and right, in order
+    def overlapping(self, left, right):
+        i = bisect.bisect_left(self.rights, left, self.first)
+        sections = []
+        while i < len(self.sections) and self.sections[i].left() <= right:
+            sections.append(self.sections[i])
+            i += 1
+        return sections
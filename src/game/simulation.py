@@ -0,0 +1,428 @@
+import pymunk
+import pymunk._chipmunk
+import random
+
+import color
+from player import Player
+from tile import Tile
+from bro import Bro
+from section import Section, SectionIndex
+from store import EntityStore, EntityView
+from pool import Pool
+from generator import SectionGenerator
+from recording import Action
+from profiler import FrameProfiler
+
+from collections import deque
+from itertools import islice
+
+# The game world: physics, sections, bros and the scrolling camera. Has no
+# window or rendering so it can be stepped headless or driven by a GameScene
+class Simulation(object):
+
+    COLORS = (color.RED, color.BLUE, color.YELLOW)
+
+    GRAVITY = (0.0, -500.0)
+    PHYSICS_FRAMERATE = 1.0 / 80
+
+    # Broadphase spatial hash, cells are one tile across
+    SPATIAL_HASH_DIM = Tile.SIZE
+    SPATIAL_HASH_COUNT = 1000
+
+    # Sections further than this from the camera and anything moving stop
+    # colliding
+    CULL_MARGIN = 4 * Tile.SIZE
+
+    # Bodies slower than this for this long are put to sleep
+    IDLE_SPEED_THRESHOLD = 5
+    SLEEP_TIME_THRESHOLD = 0.5
+
+    # Sections this far off screen still count as visible, so tiles falling
+    # or rotating over the edge do not pop in
+    DRAW_MARGIN = 2 * Tile.SIZE
+
+    DEATH_Y = -80
+
+    SCROLL_RATE = 10
+    SCROLL_ACCL = 0.4
+    SCROLL_DELAY = 2
+    DROP_LINE_START = -150
+
+    START_PROJECTION_X = -200
+    START_PROJECTION_Y = -32
+
+    # Logical game size
+    GAME_WIDTH = 900
+    GAME_HEIGHT = 480
+
+    POPULATE_PADDING = 50
+
+    # Sections committed to the world per step, more wait for later steps
+    COMMIT_BUDGET = 1
+
+    # Generate section layouts on a worker thread
+    THREADED_GENERATOR = True
+
+    # Sections come from the SectionLibrary given, limited to a (low, high)
+    # difficulty range, or from the built in tile sets. Player actions are
+    # written to the recorder, if any, and a playback feeds recorded ones in.
+    # Each part of a step is timed in a zone of the profiler
+    def __init__(self, seed=None, library=None, difficulty=None, recorder=None,
+            playback=None, profiler=None, threaded=THREADED_GENERATOR, *args, **kwargs):
+        if profiler is None:
+            profiler = FrameProfiler()
+        self.profiler = profiler
+        self.seed = seed
+        self.threaded = threaded
+        self.library = library
+        self.difficulty = difficulty
+        if library is not None and difficulty is not None:
+            library.span(*difficulty)
+        self.recorder = recorder
+        self.playback = playback
+        self.over = False
+        self.space = None
+        self.generator = None
+        self.ticks = 0
+
+    def start(self):
+        # finish any run still going
+        self.stop()
+
+        # All level randomness comes from here so a seeded run replays
+        # exactly, unseeded runs pick a seed so they can still be recorded
+        if self.playback is not None:
+            self.run_seed = self.playback.seed
+            self.playback.rewind()
+        elif self.seed is not None:
+            self.run_seed = self.seed
+        else:
+            self.run_seed = random.getrandbits(63)
+        self.random = random.Random(self.run_seed)
+        # physics steps taken this run
+        self.ticks = 0
+        if self.recorder is not None:
+            self.recorder.begin(self.run_seed)
+
+        # Create players
+        self.players = []
+        for i, color in enumerate(Simulation.COLORS):
+            self.players.append(Player(color, i))
+
+        # Restarting keeps the space and recycles the last run's entities.
+        # Pooled shapes keep their ids, which decide contact order, so runs
+        # that are recorded or replayed start from a fresh space instead
+        if self.space is None or self.recorder is not None or self.playback is not None:
+            self.create_space()
+        else:
+            self.clear()
+
+        # Upcoming section layouts, with their own seeded random generator
+        # so the worker never shares one with the main thread
+        self.generator = SectionGenerator(random.Random(self.random.random()),
+                library = self.library,
+                difficulty = self.difficulty,
+                threaded = self.threaded)
+
+        # Create first section
+        self.sections = deque()
+        # the same sections searchable by x
+        self.section_index = SectionIndex()
+        # leading sections taken out of collisions
+        self.culled = 0
+        self.current_distance = 0
+        self.push_section()
+
+        # Create entities
+        for i, player in enumerate(self.players):
+            self.add_bro(player, y=(i+2)*50)
+
+        # slowly panning camera
+        self.camera = self.start_projection()
+
+        # Game state
+        self.over = False
+        self.scroll_delay = Simulation.SCROLL_DELAY
+        self.scroll_rate = Simulation.SCROLL_RATE
+        self.drop_line = Simulation.DROP_LINE_START
+
+    def create_space(self):
+        # Create physics space, shape ids decide contact order so restart
+        # them
+        pymunk.reset_shapeid_counter()
+        self.space = pymunk.Space()
+        # Instantly correct collisions
+        #self.space.collision_bias = 0
+        self.space.gravity = Simulation.GRAVITY
+        Simulation.use_spatial_hash(self.space,
+                Simulation.SPATIAL_HASH_DIM, Simulation.SPATIAL_HASH_COUNT)
+        self.space.idle_speed_threshold = Simulation.IDLE_SPEED_THRESHOLD
+        self.space.sleep_time_threshold = Simulation.SLEEP_TIME_THRESHOLD
+
+        # Drawn state of every entity, entities is a view over it
+        self.store = EntityStore()
+        self.entities = EntityView(self.store)
+        self.bros = EntityView(self.store, Bro.KIND)
+
+        # Entities that left the world, spawned again by later sections
+        # and bros instead of being rebuilt
+        self.tile_pool = Pool(self.create_tile)
+        self.bro_pool = Pool(self.create_bro)
+
+    # Take every section and bro out of the world into the pools
+    def clear(self):
+        while self.sections:
+            self.pop_section()
+        for bro in self.bros:
+            self.store.remove(bro)
+            bro.remove_from_space()
+            self.bro_pool.release(bro)
+
+    def create_tile(self, x, y, rng, merged, color):
+        return Tile(x, y, self.space, self.store, rng, merged, color)
+
+    def create_bro(self, player, x=0, y=0, old_bro=None):
+        return Bro(player, self.space, self.store, x=x, y=y, old_bro=old_bro)
+
+    def start_projection(self):
+        left = Simulation.START_PROJECTION_X
+        bottom = Simulation.START_PROJECTION_Y
+        width = Simulation.GAME_WIDTH
+        height = Simulation.GAME_HEIGHT
+        right = width + left
+        top = height + bottom
+        return (left, top, right, bottom)
+
+    # Called from inside a step, so the run ends on the tick being taken
+    def end(self):
+        self.over = True
+        if self.recorder is not None:
+            self.recorder.end(self.ticks + 1)
+
+    # Stop generating sections ahead and finish the recorded run
+    def stop(self):
+        if self.recorder is not None:
+            self.recorder.end(self.ticks)
+        if self.generator is not None:
+            self.generator.stop()
+            self.generator = None
+
+    # Advance the world by one fixed physics step
+    def step(self, dt):
+        if self.playback is not None:
+            self.playback.feed(self)
+        with self.profiler.zone('physics'):
+            self.update_physics(dt)
+        self.update(dt)
+        self.ticks += 1
+
+    # Have a player's active bro carry out an action before the next step,
+    # returns whether there was a bro to do it
+    def control(self, index, action):
+        bro = self.players[index].active_bro()
+        if bro is None:
+            return False
+        if self.recorder is not None:
+            self.recorder.record(self.ticks, index, action)
+
+        if action == Action.JUMP:
+            bro.jump()
+        elif action == Action.MOVE_LEFT:
+            bro.move_left()
+        elif action == Action.MOVE_RIGHT:
+            bro.move_right()
+        elif action == Action.STOP_LEFT:
+            bro.stop_left()
+        elif action == Action.STOP_RIGHT:
+            bro.stop_right()
+        elif action == Action.FREEZE:
+            self.freeze_bro(bro)
+        return True
+
+    # Place moving entities between the last two steps for drawing
+    def interpolate(self, alpha):
+        self.store.interpolate(alpha)
+
+    def update(self, dt):
+
+        profiler = self.profiler
+
+        # Scroll the game and camera
+        with profiler.zone('scroll'):
+            self.scroll(dt)
+
+        # update entities
+        with profiler.zone('sync'):
+            self.store.sync()
+            for bro in self.bros:
+                bro.update(dt)
+
+        # Kill bros that have fallen
+        for bro in self.bros:
+            if bro.y < Simulation.DEATH_Y:
+                self.kill_bro(bro)
+            elif bro.x < self.drop_line:
+                bro.drop()
+
+        for tile in self.sections[0].tiles:
+            # Remove fallen tiles
+            if tile.y < Simulation.DEATH_Y:
+                self.sections[0].remove_tile(tile)
+                self.store.remove(tile)
+                tile.remove_from_space()
+                self.recycle_tile(tile)
+            # Drop tiles behind drop line
+            elif tile.x < self.drop_line:
+                pass
+                #tile.drop()
+
+        with profiler.zone('sections'):
+            # delete empty sections
+            if self.sections[0].empty():
+                self.pop_section()
+
+            # add ready made sections, only a few each step
+            budget = Simulation.COMMIT_BUDGET
+            while budget > 0 and self.current_distance * Tile.SIZE < self.populate_distance():
+                self.push_section()
+                budget -= 1
+
+        with profiler.zone('cull'):
+            self.cull_sections()
+
+    def scroll(self, dt):
+        # Scroll viewport or decrement scroll delay
+        if self.scroll_delay > 0:
+            self.scroll_delay -= dt
+            dscroll = max(0, dt - self.scroll_delay)
+        else:
+            dscroll = dt
+
+        # Accelerate scrolling
+        self.scroll_rate += Simulation.SCROLL_ACCL * dscroll
+
+        # move camera projection
+        dcamera = Simulation.get_scroll(dscroll, self.scroll_rate)
+        self.camera = Simulation.addt(self.camera, dcamera)
+
+        # move line that drops entities
+        self.drop_line += dscroll * self.scroll_rate
+
+    # pymunk 4 has no wrapper for switching to the spatial hash broadphase
+    @staticmethod
+    def use_spatial_hash(space, dim, count):
+        if hasattr(space, 'use_spatial_hash'):
+            space.use_spatial_hash(dim, count)
+        else:
+            pymunk._chipmunk.cpSpaceUseSpatialHash(space._space, dim, count)
+
+    # Add tuple element-wise
+    @staticmethod
+    def addt(a, b):
+        return (map(sum,zip(a,b)))
+
+    @staticmethod
+    def get_scroll(dt, rate):
+        return (map(lambda x: x * rate * dt, (1, 0, 1, 0)))
+
+    def update_physics(self, dt):
+        self.space.step(dt)
+        # sleeping bros still rest on what they last found
+        for bro in self.bros:
+            if bro.alive() and not bro.pymunk_body.is_sleeping:
+                bro.find_ground()
+
+    # Only sections near the camera or anything moving, such as live bros,
+    # dropped frozen bros and dropped tiles, take part in collisions
+    def cull_sections(self):
+        left = self.camera[0]
+        right = self.camera[2]
+        moving = self.store.moving()
+        if len(moving):
+            xs = self.store.state[moving, EntityStore.X]
+            left = min(left, xs.min())
+            right = max(right, xs.max())
+        left -= Simulation.CULL_MARGIN
+        right += Simulation.CULL_MARGIN
+
+        # Sections behind the camera stay culled without being visited again
+        sections = self.sections
+        while self.culled > 0 and sections[self.culled - 1].right() >= left:
+            self.culled -= 1
+        while self.culled < len(sections) and sections[self.culled].right() < left:
+            sections[self.culled].set_collidable(False)
+            self.culled += 1
+
+        for section in islice(sections, self.culled, None):
+            section.set_collidable(section.left() <= right)
+
+    # Sections within margin of the camera's left and right edges
+    def visible_sections(self, margin=DRAW_MARGIN):
+        return self.section_index.overlapping(self.camera[0] - margin, self.camera[2] + margin)
+
+    def camera_distance(self):
+        return self.camera[2]
+
+    def populate_distance(self):
+        return self.camera_distance() + Simulation.POPULATE_PADDING
+
+    def add_bro(self, player, old_bro=None, x=0, y=100):
+        #x = self.sections[0].first_tile_offset()
+        if old_bro is not None:
+            x = old_bro.last_tile.x
+            y = old_bro.last_tile.y + Tile.SIZE
+        self.bro_pool.acquire(player, x=x, y=y, old_bro=old_bro)
+
+    def kill_bro(self, bro):
+        self.store.remove(bro)
+        if bro.alive():
+            bro.die()
+        else:
+            # frozen bros that were dropped
+            bro.remove_from_space()
+        # the player only looks at its last bro, which this one no longer is
+        if bro.player.bro is bro:
+            bro.player.bro = None
+        self.bro_pool.release(bro)
+        # Check if this was the last bro standing
+        if not self.bros_remaining():
+            self.end()
+
+    def bros_remaining(self):
+        for player in self.players:
+            if player.active_bro() is not None:
+                return True
+        return False
+
+    def freeze_bro(self, bro):
+        # Prevent us from freezing if there is not last tile or the tile has dropped
+        if bro.last_tile is not None and bro.last_tile.static:
+            self.add_bro(bro.player, old_bro=bro)
+            bro.freeze()
+
+    # Commit the next generated layout to the space
+    def push_section(self):
+        layout = self.generator.next()
+        section = Section(layout.offset, self.space, self.store, self.random,
+                pool=self.tile_pool, layout=layout)
+        self.sections.append(section)
+        self.section_index.append(section)
+        self.current_distance += section.length
+
+    def pop_section(self):
+        section = self.sections.popleft()
+        self.section_index.popleft()
+        self.culled = max(0, self.culled - 1)
+        section.remove_from_space()
+        for tile in section.tiles:
+            self.store.remove(tile)
+            self.recycle_tile(tile)
+
+    # Keep a tile that left the world for a later section. Bros no longer
+    # find it as their last tile once it is out of the store
+    def recycle_tile(self, tile):
+        self.tile_pool.release(tile)
+
+    def remove_section(self, section):
+        self.sections.remove(section)
+        self.section_index.remove(section)
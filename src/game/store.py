@@ -0,0 +1,170 @@
+import numpy
+
+from registry import Registry
+
+# Structure of arrays holding the position, rotation and colour of every live
+# Entity. Moving bodies are read back from physics in one pass per step and
+# renderers take the arrays directly. Each time an entity is added it gets a
+# new handle, which finds it until it is removed
+class EntityStore(object):
+
+    CAPACITY = 256
+
+    # Columns of the state arrays
+    X = 0
+    Y = 1
+    ROT = 2
+
+    def __init__(self, capacity=CAPACITY, *args, **kwargs):
+        self.count = 0
+        self.entities = []
+        # live entities of each kind
+        self.kinds = {}
+
+        # physics state of the last two steps and the interpolated drawn state
+        self.state = numpy.zeros((capacity, 3))
+        self.last_state = numpy.zeros((capacity, 3))
+        self.drawn = numpy.zeros((capacity, 3))
+        self.rgba = numpy.ones((capacity, 4))
+        # colour before any tints
+        self.base = numpy.ones((capacity, 3))
+        self.static = numpy.zeros(capacity, dtype=bool)
+        self.kind = numpy.zeros(capacity, dtype=numpy.int8)
+
+        self.handles = {}
+        self.next_handle = 0
+
+        # slots and bodies of non static entities, rebuilt when they change
+        self._moving = None
+        self._moving_bodies = None
+
+    def capacity(self):
+        return len(self.state)
+
+    def add(self, entity, x, y, rot, static):
+        if self.count == self.capacity():
+            self._grow()
+
+        slot = self.count
+        self.count += 1
+        self.entities.append(entity)
+        entity.slot = slot
+        entity.handle = self.next_handle
+        self.handles[entity.handle] = entity
+        self.next_handle += 1
+
+        self.state[slot] = (x, y, rot)
+        self.last_state[slot] = self.state[slot]
+        self.drawn[slot] = self.state[slot]
+        self.rgba[slot] = 1
+        self.base[slot] = 1
+        self.static[slot] = static
+        self.kind[slot] = entity.KIND
+        self.of_kind(entity.KIND).add(entity)
+        self._moving = None
+        return slot
+
+    # Swap the last entity into the removed slot so arrays stay packed
+    def remove(self, entity):
+        slot = entity.slot
+        last = self.count - 1
+        if slot != last:
+            moved = self.entities[last]
+            for array in (self.state, self.last_state, self.drawn, self.rgba,
+                    self.base, self.static, self.kind):
+                array[slot] = array[last]
+            self.entities[slot] = moved
+            moved.slot = slot
+
+        self.entities.pop()
+        self.count -= 1
+        self.kinds[entity.KIND].remove(entity)
+        del self.handles[entity.handle]
+        entity.slot = None
+        entity.handle = None
+        self._moving = None
+
+    # The entity a handle was given to, None once it left the store
+    def get(self, handle):
+        return self.handles.get(handle)
+
+    def of_kind(self, kind):
+        if kind not in self.kinds:
+            self.kinds[kind] = Registry()
+        return self.kinds[kind]
+
+    def set_static(self, entity, static):
+        self.static[entity.slot] = static
+        self._moving = None
+
+    def _grow(self):
+        size = self.capacity() * 2
+        for name in ('state', 'last_state', 'drawn', 'rgba', 'base', 'static', 'kind'):
+            old = getattr(self, name)
+            new = numpy.zeros((size,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def moving(self):
+        if self._moving is None:
+            self._moving = numpy.flatnonzero(~self.static[:self.count])
+            self._moving_bodies = [self.entities[i].pymunk_body for i in self._moving]
+        return self._moving
+
+    # Copy positions of every moving body out of the physics space
+    def sync(self):
+        n = self.count
+        self.last_state[:n] = self.state[:n]
+
+        moving = self.moving()
+        if len(moving) == 0:
+            return
+        bodies = self._moving_bodies
+        positions = numpy.array([tuple(body.position) for body in bodies])
+        angles = numpy.fromiter((body.angle for body in bodies), float, len(bodies))
+        self.state[moving, EntityStore.X] = positions[:, 0]
+        self.state[moving, EntityStore.Y] = positions[:, 1]
+        self.state[moving, EntityStore.ROT] = numpy.degrees(angles)
+
+    # Place drawn state between the last two steps
+    def interpolate(self, alpha):
+        n = self.count
+        last = self.last_state[:n]
+        self.drawn[:n] = last + (self.state[:n] - last) * alpha
+
+    # Slots of every live entity of a kind
+    def slots(self, kind):
+        return numpy.flatnonzero(self.kind[:self.count] == kind)
+
+# Read only sequence of the live entities in a store, optionally one kind.
+# Like a Registry it can be iterated while entities are removed
+class EntityView(object):
+
+    def __init__(self, store, kind=None, *args, **kwargs):
+        self.store = store
+        self.kind = kind
+
+    def _entities(self):
+        if self.kind is None:
+            return self.store.entities
+        return self.store.of_kind(self.kind)
+
+    def __len__(self):
+        return len(self._entities())
+
+    def __iter__(self):
+        if self.kind is not None:
+            return iter(self.store.of_kind(self.kind))
+        return self._iter_all()
+
+    # the store swaps the last entity into a removed slot, walk from the back
+    def _iter_all(self):
+        entities = self.store.entities
+        slot = len(entities) - 1
+        while slot >= 0:
+            if slot < len(entities):
+                yield entities[slot]
+            slot -= 1
+
+    def __getitem__(self, index):
+        return self._entities()[index]
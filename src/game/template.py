@@ -0,0 +1,49 @@
+from tile import Tile
+from tilerun import TileRun
+
+# A Section grid, from Section.TILE_SETS or a SectionLibrary, compiled
+# once: the grid position of every tile, static tiles per column and the
+# rectangles merged tiles collide as, with their shape vertices at offset 0
+class SectionTemplate(object):
+
+    def __init__(self, grid, *args, **kwargs):
+        self.length = len(grid[0])
+        height = len(grid) - 1
+
+        # tile grid positions in the order tiles are created
+        self.cells = []
+        self.column_counts = [0] * self.length
+        for y, row in enumerate(grid):
+            for x, val in enumerate(row):
+                if val == 1:
+                    self.cells.append((x, height - y))
+                    self.column_counts[x] += 1
+
+        # indices into cells for each merged rectangle with its vertices
+        indices = dict((cell, i) for i, cell in enumerate(self.cells))
+        self.rects = []
+        for members, rect in TileRun.rectangles(indices):
+            self.rects.append((members, TileRun.vertices(*rect)))
+
+# Everything needed to build one Section that does not touch the physics
+# space: its template, offset, tile colours and merged shape vertices
+# moved into place. Layouts can be worked out ahead of time off the main
+# thread
+class SectionLayout(object):
+
+    def __init__(self, offset, template, colors, *args, **kwargs):
+        self.offset = offset
+        self.template = template
+        self.length = template.length
+        self.colors = colors
+
+        dx = offset * Tile.SIZE
+        self.rects = []
+        for members, vertices in template.rects:
+            self.rects.append((members, [(x + dx, y) for x, y in vertices]))
+
+    # Lay out a template at offset with randomly coloured tiles
+    @staticmethod
+    def create(offset, template, rng):
+        colors = [Tile.random_color(rng) for cell in template.cells]
+        return SectionLayout(offset, template, colors)
@@ -1,12 +1,13 @@
 import entity
-import resources
-from pyglet.app import WeakSet
 
 import random
 
-# A single tile making up the world
+# A single tile making up the world, tinted by the players whose bros last
+# stood on it
 class Tile(entity.Entity):
 
+    __slots__ = ('rng', 'mesh', 'mesh_index', 'merged', 'run', 'section', 'tints')
+
     MASS = 20
     FRICTION = 0.5
     SIZE = 32
@@ -21,10 +22,11 @@ class Tile(entity.Entity):
     DROP_OFFSET = (0, SIZE // 2)
 
     COLLISION_TYPE = 1
+    KIND = 1
 
-    def __init__(self, x, y, space, *args, **kwargs):
-        self.space = space
-        super(Tile, self).__init__(space,
+    def __init__(self, x, y, space, store, rng=random, merged=False, color=None, *args, **kwargs):
+        self._reset(rng, merged)
+        super(Tile, self).__init__(space, store,
                 x = x * Tile.SIZE,
                 y = y * Tile.SIZE,
                 angle = 0,
@@ -33,51 +35,99 @@ class Tile(entity.Entity):
                 friction = Tile.FRICTION,
                 collision_type = Tile.COLLISION_TYPE,
                 mass = Tile.MASS,
-                static = True,
-                texture=resources.box)
-
-        # random colour
-        if random.random() < Tile.WHITE_RATIO:
-            brightness = random.random() % Tile.BRIGHTNESS_RANGE + Tile.BRIGHTNESS_MIN
-            self.rgb = brightness, brightness, brightness
-
-        self.orig_color = self.rgb
-        self.tints = WeakSet()
+                static = True)
+        self._paint(color)
+
+    # Reuse a pooled tile at a new grid position
+    def spawn(self, x, y, rng=random, merged=False, color=None):
+        self._reset(rng, merged)
+        self.place(x * Tile.SIZE, y * Tile.SIZE, static = True)
+        self._paint(color)
+
+    def _reset(self, rng, merged):
+        self.rng = rng
+        # batched mesh drawing this tile, if any
+        self.mesh = None
+        # merged tiles collide through the shape of their TileRun
+        self.merged = merged
+        self.run = None
+        # section tracking this tile while static
+        self.section = None
+        # bits of the players tinting the tile
+        self.tints = 0
+
+    # Colour given by a SectionLayout, otherwise picked here
+    def _paint(self, color):
+        if color is None:
+            color = Tile.random_color(self.rng)
+        self.rgb = color
+        self.store.base[self.slot] = color
+
+    @staticmethod
+    def random_color(rng):
+        if rng.random() < Tile.WHITE_RATIO:
+            brightness = rng.random() % Tile.BRIGHTNESS_RANGE + Tile.BRIGHTNESS_MIN
+            return brightness, brightness, brightness
+        return 1.0, 1.0, 1.0
+
+    def _set_static(self, x, y, angle):
+        if not self.merged:
+            super(Tile, self)._set_static(x, y, angle)
+
+    def _set_dynamic(self, x, y, angle):
+        super(Tile, self)._set_dynamic(x, y, angle)
+        if self.section is not None:
+            self.section.release_tile(self)
 
     def drop(self):
+        # a culled section's shapes must be back in the space to be taken out
+        if self.section is not None:
+            self.section.set_collidable(True)
+        if self.run is not None:
+            self.run.release(self)
         self.static = False
         self.untint_all()
-        self.pymunk_body.apply_impulse(random.choice(Tile.DROP_IMPULSES), Tile.DROP_OFFSET)
+        self.pymunk_body.apply_impulse(self.rng.choice(Tile.DROP_IMPULSES), Tile.DROP_OFFSET)
+        if self.mesh is not None:
+            self.mesh.release(self)
 
     def set_last_tile_for(self, bro):
-        self.tint(bro.color)
+        self.tint(bro.player.bit, bro.color)
 
     def unset_last_tile_for(self, bro):
-        self.untint(bro.color)
-
-    def tint(self, color):
-        self.tints.add(color)
+        self.untint(bro.player.bit, bro.color)
+
+    # Overlay a player's colour, once however many of their bros stand here
+    def tint(self, bit, color):
+        if self.tints & bit:
+            return
+        self.tints |= bit
+        t = color.fade(Tile.BRIGHTNESS_RANGE).invert()
+        self.red -= t.red
+        self.green -= t.green
+        self.blue -= t.blue
         self._color()
 
-    def untint(self, color):
-        if color in self.tints:
-            self.tints.remove(color)
+    def untint(self, bit, color):
+        if not self.tints & bit:
+            return
+        self.tints &= ~bit
+        if self.tints == 0:
+            self.rgb = self.store.base[self.slot]
+        else:
+            t = color.fade(Tile.BRIGHTNESS_RANGE).invert()
+            self.red += t.red
+            self.green += t.green
+            self.blue += t.blue
         self._color()
 
     def untint_all(self):
-        for tint in self.tints:
-            self.tints.remove(tint)
+        self.tints = 0
+        self.rgb = self.store.base[self.slot]
         self._color()
 
+    # Show the new colour in the tile's mesh
     def _color(self):
-        # start with orig colour
-        self.red = self.orig_color[0]
-        self.green = self.orig_color[1]
-        self.blue = self.orig_color[2]
-        # overlay each tint
-        for tint in self.tints:
-            t = tint.fade(Tile.BRIGHTNESS_RANGE).invert()
-            self.red -= t.red
-            self.green -= t.green
-            self.blue -= t.blue
+        if self.mesh is not None:
+            self.mesh.recolor(self)
 
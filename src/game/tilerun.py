@@ -0,0 +1,83 @@
+import pymunk
+
+from tile import Tile
+
+# A rectangle of neighbouring static tiles that collides as one shape. The
+# tiles are still drawn and dropped one at a time, taking a tile out splits
+# the rest into new runs
+class TileRun(object):
+
+    def __init__(self, tiles, space, runs, vertices, *args, **kwargs):
+        self.tiles = tiles
+        self.space = space
+        # every run of the section, kept up to date as runs split
+        self.runs = runs
+        runs.add(self)
+
+        shape = pymunk.Poly(space.static_body, vertices)
+        shape.friction = Tile.FRICTION
+        shape.collision_type = Tile.COLLISION_TYPE
+        shape.entity = self
+        space.add(shape)
+        self.pymunk_shape = shape
+
+        for t in tiles:
+            t.run = self
+
+    # The tile standing in for the run when something touches it at x, y
+    def tile_near(self, x, y):
+        return min(self.tiles, key = lambda t: (abs(t.x - x), abs(t.y - y)))
+
+    def release(self, tile):
+        self.remove_from_space()
+        tile.run = None
+        tile.merged = False
+        TileRun.merge([t for t in self.tiles if t is not tile], self.space, self.runs)
+
+    def remove_from_space(self):
+        self.runs.discard(self)
+        self.space.remove(self.pymunk_shape)
+
+    @staticmethod
+    def merge(tiles, space, runs):
+        cells = {}
+        for t in tiles:
+            cells[(int(round(t.x / Tile.SIZE)), int(round(t.y / Tile.SIZE)))] = t
+
+        for run_tiles, rect in TileRun.rectangles(cells):
+            TileRun(run_tiles, space, runs, TileRun.vertices(*rect))
+
+    # Greedily cover a grid of cells with rectangles, growing each one right
+    # along its row first and then up over whole rows. Cells maps (x, y) grid
+    # positions to items, returns each rectangle's items with its x, y,
+    # width and height
+    @staticmethod
+    def rectangles(cells):
+        cells = dict(cells)
+        rects = []
+        for x, y in sorted(cells, key = lambda cell: (cell[1], cell[0])):
+            if (x, y) not in cells:
+                continue
+            width = 1
+            while (x + width, y) in cells:
+                width += 1
+            height = 1
+            while all((x + i, y + height) in cells for i in range(width)):
+                height += 1
+
+            items = []
+            for j in range(height):
+                for i in range(width):
+                    items.append(cells.pop((x + i, y + j)))
+            rects.append((items, (x, y, width, height)))
+        return rects
+
+    # Shape vertices covering a rectangle of grid cells
+    @staticmethod
+    def vertices(x, y, width, height):
+        h = Tile.SIZE // 2
+        left = x * Tile.SIZE - h
+        right = (x + width - 1) * Tile.SIZE + h
+        bottom = y * Tile.SIZE - h
+        top = (y + height - 1) * Tile.SIZE + h
+        return [(left, top), (right, top), (right, bottom), (left, bottom)]
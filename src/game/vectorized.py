@@ -0,0 +1,257 @@
+import numpy
+import random
+
+from simulation import Simulation
+from generator import SectionGenerator
+from recording import Action
+from bro import Bro
+from tile import Tile
+
+# Many independent games stepped in lockstep with numpy instead of one
+# pymunk space each. Every world is the tile grid of the level its seed
+# generates in a Simulation, with one bro per player moving as an axis
+# aligned box under GRAVITY at Bro.SPEED, jumping with Bro.JUMP_VECTOR.
+# Bros only collide with the grid: frozen bros are stamped into it at the
+# cell nearest to them, and live bros pass through each other. Tiles never
+# drop in the game, so the grid only changes when bros freeze or drop
+class VectorWorlds(object):
+
+    PLAYERS = len(Simulation.COLORS)
+    # Rows above the highest tile a bro can still be in
+    HEADROOM = 4
+    # Keeps box edges touching a cell from counting as inside it
+    EPSILON = 1e-6
+
+    # Action meaning no key was pressed
+    IDLE = -1
+
+    def __init__(self, seeds, max_frames, library=None, difficulty=None, *args, **kwargs):
+        self.seeds = list(seeds)
+        self.count = len(self.seeds)
+        self.library = library
+        self.difficulty = difficulty
+
+        # a bro never gets further than walking for max_frames lets it
+        reach = Bro.SPEED * max_frames * Simulation.PHYSICS_FRAMERATE
+        self.columns = int(reach + Simulation.GAME_WIDTH) // Tile.SIZE + 1
+        self.create_levels()
+        self.start()
+
+    # Cells of each template, kept as arrays for stamping into the grid
+    def template_cells(self, template):
+        if template not in self.cells:
+            cells = numpy.array(template.cells, dtype=int).reshape(-1, 2)
+            self.cells[template] = (cells[:, 0], cells[:, 1])
+        return self.cells[template]
+
+    # The same sections a Simulation started with each seed would push
+    def create_levels(self):
+        self.cells = {}
+        levels = []
+        for seed in self.seeds:
+            rng = random.Random(seed)
+            generator = SectionGenerator(random.Random(rng.random()),
+                    library = self.library,
+                    difficulty = self.difficulty,
+                    threaded = False)
+            level = []
+            offset = 0
+            while offset < self.columns:
+                layout = generator.next()
+                level.append((layout.offset, self.template_cells(layout.template)))
+                offset += layout.length
+            levels.append(level)
+
+        rows = max(y.max() for level in levels for offset, (x, y) in level if len(y))
+        self.rows = rows + 1 + VectorWorlds.HEADROOM
+        self.tiles = numpy.zeros((self.count, self.rows, self.columns), dtype=bool)
+        for world, level in enumerate(levels):
+            for offset, (x, y) in level:
+                x = x + offset
+                inside = x < self.columns
+                self.tiles[world, y[inside], x[inside]] = True
+
+    def start(self):
+        shape = (self.count, VectorWorlds.PLAYERS)
+        # frozen bros in each cell
+        self.frozen = numpy.zeros(self.tiles.shape, dtype=numpy.int8)
+
+        # bros start where Simulation.add_bro puts them
+        self.x = numpy.zeros(shape)
+        self.y = numpy.tile((numpy.arange(VectorWorlds.PLAYERS) + 2) * 50.0, (self.count, 1))
+        self.vx = numpy.zeros(shape)
+        self.vy = numpy.zeros(shape)
+        self.direction = numpy.zeros(shape, dtype=int)
+        self.alive = numpy.ones(shape, dtype=bool)
+        self.grounded = numpy.zeros(shape, dtype=bool)
+        # grid cell of the tile last stood on, -1 when there is none
+        self.last_column = numpy.full(shape, -1, dtype=int)
+        self.last_row = numpy.full(shape, -1, dtype=int)
+
+        self.distance = numpy.zeros(shape, dtype=int)
+        self.deaths = numpy.zeros(shape, dtype=int)
+        self.freezes = numpy.zeros(shape, dtype=int)
+
+        # scrolling is the same in every world
+        self.scroll_delay = Simulation.SCROLL_DELAY
+        self.scroll_rate = Simulation.SCROLL_RATE
+        self.drop_line = Simulation.DROP_LINE_START
+        self.ticks = 0
+        # steps each world took before it was over
+        self.frames = numpy.zeros(self.count, dtype=int)
+
+    # Worlds where no player has a bro left
+    def over(self):
+        return ~self.alive.any(axis=1)
+
+    @staticmethod
+    def cell(position):
+        return numpy.floor((position + Tile.SIZE / 2.0) / Tile.SIZE).astype(int)
+
+    # Whether each (world, column, row) holds a tile or a frozen bro,
+    # nothing is outside the grid
+    def solid(self, worlds, columns, rows):
+        inside = (columns >= 0) & (columns < self.columns) & (rows >= 0) & (rows < self.rows)
+        columns = numpy.clip(columns, 0, self.columns - 1)
+        rows = numpy.clip(rows, 0, self.rows - 1)
+        return inside & (self.tiles[worlds, rows, columns] | (self.frozen[worlds, rows, columns] > 0))
+
+    # Advance every world by one physics step, actions holding an Action
+    # or IDLE for each world and player
+    def step(self, actions, dt=Simulation.PHYSICS_FRAMERATE):
+        self.frames[~self.over()] += 1
+        self.control(actions)
+        self.update_physics(dt)
+        self.update(dt)
+        self.ticks += 1
+
+    def control(self, actions):
+        alive = self.alive
+        jump = alive & (actions == Action.JUMP) & self.grounded
+        self.vy[jump] += Bro.JUMP_VECTOR[1] / float(Bro.MASS)
+        self.grounded[jump] = False
+
+        self.direction[alive & (actions == Action.MOVE_LEFT)] = -1
+        self.direction[alive & (actions == Action.MOVE_RIGHT)] = 1
+        self.direction[alive & (actions == Action.STOP_LEFT) & (self.direction == -1)] = 0
+        self.direction[alive & (actions == Action.STOP_RIGHT) & (self.direction == 1)] = 0
+
+        freeze = alive & (actions == Action.FREEZE) & (self.last_column >= 0)
+        if freeze.any():
+            self.freeze(freeze)
+
+    # Stamp the bros into the grid and give their players a new one on top
+    # of the tile they last stood on
+    def freeze(self, mask):
+        worlds, players = numpy.nonzero(mask)
+        columns = VectorWorlds.cell(self.x[mask])
+        rows = VectorWorlds.cell(self.y[mask])
+        inside = (columns >= 0) & (columns < self.columns) & (rows >= 0) & (rows < self.rows)
+        numpy.add.at(self.frozen, (worlds[inside], rows[inside], columns[inside]), 1)
+        self.freezes[mask] += 1
+
+        columns = self.last_column[mask]
+        rows = self.last_row[mask] + 1
+        # climb over bros frozen where the new one would appear
+        blocked = self.solid(worlds, columns, rows)
+        while blocked.any():
+            rows[blocked] += 1
+            blocked &= self.solid(worlds, columns, rows)
+        self.x[mask] = columns * Tile.SIZE
+        self.y[mask] = rows * Tile.SIZE
+        self.vx[mask] = 0
+        self.vy[mask] = 0
+        self.grounded[mask] = False
+
+    def update_physics(self, dt):
+        alive = self.alive
+        worlds = numpy.nonzero(alive)[0]
+        half = Bro.SIZE / 2.0
+        size = Tile.SIZE
+        epsilon = VectorWorlds.EPSILON
+
+        vx = self.vx[alive]
+        vy = self.vy[alive] + Simulation.GRAVITY[1] * dt
+        x = self.x[alive] + vx * dt
+        y = self.y[alive]
+
+        # move across, stopping at the first cell in the way
+        bottom = VectorWorlds.cell(y - half + epsilon)
+        top = VectorWorlds.cell(y + half - epsilon)
+        forward = vx > 0
+        lead = numpy.where(forward, VectorWorlds.cell(x + half - epsilon), VectorWorlds.cell(x - half + epsilon))
+        hit = (vx != 0) & (self.solid(worlds, lead, bottom) | self.solid(worlds, lead, top))
+        x = numpy.where(hit, numpy.where(forward, lead - 1, lead + 1) * size, x)
+        vx[hit] = 0
+
+        # then up or down, landing on whatever is below
+        y = y + vy * dt
+        left = VectorWorlds.cell(x - half + epsilon)
+        right = VectorWorlds.cell(x + half - epsilon)
+        up = vy > 0
+        lead = numpy.where(up, VectorWorlds.cell(y + half - epsilon), VectorWorlds.cell(y - half + epsilon))
+        hit = (vy != 0) & (self.solid(worlds, left, lead) | self.solid(worlds, right, lead))
+        y = numpy.where(hit, numpy.where(up, lead - 1, lead + 1) * size, y)
+        vy[hit] = 0
+        landed = hit & ~up
+
+        # a tile, not a frozen bro, under the middle of a bro is its last
+        middle = VectorWorlds.cell(x)
+        inside = (middle >= 0) & (middle < self.columns) & (lead >= 0)
+        on_tile = landed & inside
+        on_tile[on_tile] = self.tiles[worlds[on_tile], lead[on_tile], middle[on_tile]]
+        last_column = self.last_column[alive]
+        last_row = self.last_row[alive]
+        last_column[on_tile] = middle[on_tile]
+        last_row[on_tile] = lead[on_tile]
+
+        self.x[alive] = x
+        self.y[alive] = y
+        self.vx[alive] = vx
+        self.vy[alive] = vy
+        self.grounded[alive] = landed
+        self.last_column[alive] = last_column
+        self.last_row[alive] = last_row
+
+    # Scrolling, walking, falling out of the world and dropping frozen bros
+    # as in Simulation.update
+    def update(self, dt):
+        if self.scroll_delay > 0:
+            self.scroll_delay -= dt
+            dscroll = max(0, dt - self.scroll_delay)
+        else:
+            dscroll = dt
+        self.scroll_rate += Simulation.SCROLL_ACCL * dscroll
+        self.drop_line += dscroll * self.scroll_rate
+
+        alive = self.alive
+        self.vx[alive] = self.direction[alive] * Bro.SPEED
+        self.distance[alive] = numpy.maximum(self.x[alive], self.distance[alive]).astype(int)
+
+        fallen = alive & (self.y < Simulation.DEATH_Y)
+        self.alive[fallen] = False
+        self.deaths[fallen] += 1
+
+        # frozen bros behind the drop line fall out of the world
+        dropped = int(numpy.ceil(self.drop_line / Tile.SIZE))
+        if dropped > 0:
+            self.frozen[:, :, :dropped] = 0
+
+    # Per world results in the form of BatchRunner's runs
+    def results(self, elapsed=0.0, cpu=0.0):
+        over = self.over()
+        results = []
+        for world, seed in enumerate(self.seeds):
+            results.append({
+                'seed': seed,
+                'frames': int(self.frames[world]),
+                'over': bool(over[world]),
+                'elapsed': elapsed / self.count,
+                'cpu': cpu / self.count,
+                'players': [{
+                    'distance': int(self.distance[world, player]),
+                    'deaths': int(self.deaths[world, player]),
+                    'freezes': int(self.freezes[world, player])
+                    } for player in range(VectorWorlds.PLAYERS)]
+                })
+        return results
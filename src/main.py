@@ -11,9 +11,17 @@ class Game(pyglet.window.Window):
 
     KEY_BINDINGS = {
             'reset': pyglet.window.key.R,
-            'fullscreen': pyglet.window.key.F11
+            'fullscreen': pyglet.window.key.F11,
+            'profile_graph': pyglet.window.key.F10,
+            'profile_export': pyglet.window.key.F9
             }
 
+    # Where F9 writes the profiler's frame timings
+    PROFILE_EXPORT = 'profile'
+
+    # Left edge of the profiler graph, next to the fps display
+    PROFILE_GRAPH_X = 100
+
     def __init__(self, *args, **kwargs):
         # set window size
         if Game.WINDOW_FULLSCREEN:
@@ -36,15 +44,27 @@ class Game(pyglet.window.Window):
         # game scenes, these include the main game and the supporting menu scenes
         self._current_scene = None
 
+        # only changes with the window size
+        self.projection = self.static_projection()
+
+        # draws grouped by projection each frame
+        self.render_plan = game.render.RenderPlan()
+
     def static_projection(self):
         return (0, self.height, self.width, 0)
 
     def start(self):
         # track fps
         self.fps_display = pyglet.clock.ClockDisplay()
+        self.profile_graph = None
+        self.show_profile_graph = game.options.PROFILE_GRAPH
 
-        # Create and start the first scene
-        self.current_scene = game.scene.GameScene(self)
+        # Create and start the first scene, replaying recorded input if asked
+        if game.options.REPLAY:
+            runs = game.recording.Playback.load(game.options.REPLAY)
+            self.current_scene = game.scene.ReplayScene(self, runs, game.options.REPLAY_SPEED)
+        else:
+            self.current_scene = game.scene.GameScene(self)
         self.current_scene.start()
 
         # start the game loop
@@ -57,9 +77,10 @@ class Game(pyglet.window.Window):
         # stop the game loop
         pyglet.app.exit()
 
+    # Restart the current scene in place, it keeps its world to recycle
     def reset(self):
-        self.stop()
-        self.start()
+        if self.current_scene is not None:
+            self.current_scene.reset()
 
     def update(self, dt):
         # update the current scene
@@ -67,13 +88,34 @@ class Game(pyglet.window.Window):
             self.current_scene.update(dt)
 
     def on_draw(self):
-        rabbyt.clear()
+        plan = self.render_plan
+        plan.begin(self.width, self.height)
         # Draw the current scene
         if self.current_scene is not None:
-            self.current_scene.on_draw()
-        # Draw fps
-        rabbyt.set_viewport((self.width, self.height), projection=self.static_projection())
+            self.current_scene.plan(plan)
+        # Draw fps and frame timings over it
+        plan.add(self.get_size(), self.projection, self.draw_overlay)
+        plan.execute()
+
+    def draw_overlay(self):
         self.fps_display.draw()
+        profiler = self.profiler()
+        if self.show_profile_graph and profiler is not None:
+            if self.profile_graph is None or self.profile_graph.profiler is not profiler:
+                self.profile_graph = game.render.ProfilerGraph(profiler, x=Game.PROFILE_GRAPH_X)
+            self.profile_graph.draw()
+
+    def profiler(self):
+        if self.current_scene is None:
+            return None
+        return self.current_scene.profiler
+
+    # Write the profiler's recent frames as JSON and CSV
+    def export_profile(self):
+        profiler = self.profiler()
+        if profiler is not None:
+            profiler.export_json(Game.PROFILE_EXPORT + '.json')
+            profiler.export_csv(Game.PROFILE_EXPORT + '.csv')
 
     def on_key_press(self, symbol, modifiers):
         # Global
@@ -81,6 +123,10 @@ class Game(pyglet.window.Window):
             self.reset()
         elif symbol == Game.KEY_BINDINGS['fullscreen']:
             self.toggle_fullscreen()
+        elif symbol == Game.KEY_BINDINGS['profile_graph']:
+            self.show_profile_graph = not self.show_profile_graph
+        elif symbol == Game.KEY_BINDINGS['profile_export']:
+            self.export_profile()
         # have the current scene handle remaining inputs
         elif self.current_scene is not None:
             self.current_scene.on_key_press(symbol, modifiers)
@@ -89,12 +135,15 @@ class Game(pyglet.window.Window):
         self.set_fullscreen(not self.fullscreen)
         if not self.fullscreen:
             self.set_size(Game.WINDOW_WIDTH, Game.WINDOW_HEIGHT)
+        # lay out again even when no resize event follows
+        self.on_resize(self.width, self.height)
 
     def on_key_release(self, symbol, modifiers):
         if self.current_scene is not None:
             self.current_scene.on_key_release(symbol, modifiers)
 
     def on_resize(self, width, height):
+        self.projection = self.static_projection()
         if self.current_scene is not None:
             self.current_scene.on_resize(width, height)
 
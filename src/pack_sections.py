@@ -0,0 +1,38 @@
+import os
+import json
+import argparse
+
+# Packing sections needs no window
+os.environ['SBB_HEADLESS'] = '1'
+
+import game
+from game.section import Section
+from game.library import SectionLibrary
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack section grids into a section library')
+    parser.add_argument('output',
+            help='library file to write')
+    parser.add_argument('--input', default=None,
+            help='JSON list of {"grid": [[0, 1, ...], ...], "weight": 1, "difficulty": 0}, '
+                 'defaults to the built in tile sets')
+    args = parser.parse_args()
+
+    if args.input is None:
+        sections = [{'grid': grid} for grid in Section.TILE_SETS]
+    else:
+        with open(args.input) as f:
+            sections = json.load(f)
+
+    try:
+        SectionLibrary.write(args.output,
+                [s['grid'] for s in sections],
+                weights = [float(s.get('weight', 1)) for s in sections],
+                difficulties = [int(s.get('difficulty', 0)) for s in sections])
+    except ValueError as e:
+        parser.error(str(e))
+    print("%d sections written to %s" % (len(sections), args.output))
+
+# Pack sections when running this file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import os
+import argparse
+
+# Never open a window or touch OpenGL
+os.environ['SBB_HEADLESS'] = '1'
+
+import game
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded input without a display, as fast as possible')
+    parser.add_argument('log',
+            help='input log written with SBB_RECORD')
+    parser.add_argument('--run', type=int, default=None,
+            help='only replay this run of the log, counting from 0')
+    parser.add_argument('--library', default=None,
+            help='section library the runs were played with')
+    parser.add_argument('--difficulty', type=int, nargs=2, default=None,
+            metavar=('LOW', 'HIGH'),
+            help='difficulty range the runs were played with')
+    args = parser.parse_args()
+
+    runs = game.recording.Playback.load(args.log)
+    if args.run is not None:
+        runs = [runs[args.run]]
+    library = None
+    if args.library is not None:
+        library = game.library.SectionLibrary(args.library)
+
+    for i, playback in enumerate(runs):
+        simulation = game.simulation.Simulation(library=library, difficulty=args.difficulty,
+                playback=playback)
+        runner = game.headless.HeadlessRunner(simulation)
+        fps = runner.run(max_frames=playback.length())
+        distances = [player.distance for player in simulation.players]
+        print("run %d: %d ticks in %.2fs (%.1f ticks/s), distances %s" % (
+            i, runner.frames, runner.elapsed, fps, distances))
+
+# Replay input when running this file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import os
+import argparse
+
+# Never open a window or touch OpenGL
+os.environ['SBB_HEADLESS'] = '1'
+
+import game
+
+def main():
+    parser = argparse.ArgumentParser(description='Run Stair Bridge Bros without a display')
+    parser.add_argument('--frames', type=int, default=None,
+            help='stop after this many simulated frames')
+    parser.add_argument('--seconds', type=float, default=10,
+            help='stop after this many seconds of wall time')
+    parser.add_argument('--seed', type=int, default=None,
+            help='seed the level generator for a reproducible run')
+    parser.add_argument('--library', default=None,
+            help='pick sections from this section library file')
+    parser.add_argument('--profile', default=None, metavar='PREFIX',
+            help='write frame timings to PREFIX.json and PREFIX.csv')
+    parser.add_argument('--difficulty', type=int, nargs=2, default=None,
+            metavar=('LOW', 'HIGH'),
+            help='only use library sections with a difficulty in this range')
+    args = parser.parse_args()
+
+    library = None
+    if args.library is not None:
+        library = game.library.SectionLibrary(args.library)
+    simulation = game.simulation.Simulation(args.seed, library, args.difficulty)
+    runner = game.headless.HeadlessRunner(simulation)
+    fps = runner.run(max_frames=args.frames, max_seconds=args.seconds)
+    print("%d frames in %.2fs (%.1f frames/s)" % (runner.frames, runner.elapsed, fps))
+
+    if args.profile is not None:
+        profiler = simulation.profiler
+        profiler.export_json(args.profile + '.json')
+        profiler.export_csv(args.profile + '.csv')
+        summary = profiler.summary()
+        if 'frame' not in summary:
+            print("no frames were profiled")
+        for name in ['frame'] + profiler.names:
+            if name not in summary:
+                continue
+            stats = summary[name]
+            print("%-10s p50 %.3fms  p90 %.3fms  p99 %.3fms  max %.3fms" % (
+                name, stats['p50'], stats['p90'], stats['p99'], stats['max']))
+
+# Start simulation when running this file
+if __name__ == '__main__':
+    main()